@@ -0,0 +1,98 @@
+"""
+Shared layer between pywikibot's bot classes and the bot scripts.
+
+Most scripts parse every page they get with wikitextparser or
+mwparserfromhell, although on a broad generator nearly all pages contain
+nothing they would change. A bot declares what must occur in the text of a
+page for it to have anything to do::
+
+    class BasicBot(PrefilterBot, SingleSiteBot, ExistingPageBot, ...):
+        prefilter = ('<font', '<tt', '<strike')
+
+:class:`PrefilterBot` looks for any of these strings in the raw text,
+ignoring case, with one compiled regex scan in ``skip_page``: before
+``treat_page`` parses anything and before any diff or save. A prefilter
+only has to be a necessary condition; a page that passes it is treated as
+before. A bot without a prefilter gets every page.
+
+Many ``treat_page`` methods call ``put_current`` even when they changed
+nothing. :class:`CountingBot`, a base of :class:`PrefilterBot`, returns
+from such calls at once, before the edit summary, the diff and the save
+machinery. It also counts the pages of a run by outcome and prints a
+summary at the end::
+
+    1200 pages: 37 parsed, 5 changed, 5 saved, 32 skipped as no-op,
+    1163 skipped by prefilter
+"""
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+
+import pywikibot
+
+
+@lru_cache(maxsize=None)
+def compile_prefilter(literals: tuple[str, ...]) -> re.Pattern:
+    """Return a case-insensitive regex matching any of *literals*."""
+    # longer strings first, so that none is shadowed by its own prefix
+    ordered = sorted(set(literals), key=len, reverse=True)
+    return re.compile('|'.join(map(re.escape, ordered)), re.IGNORECASE)
+
+
+class CountingBot:
+
+    """Mixin skipping saves that change nothing and counting the outcomes.
+
+    Put it in the bases of a CurrentPageBot subclass, before the pywikibot
+    classes. The counts are kept in pywikibot's ``self.counter``:
+    'read' pages reached ``treat_page`` (parsed), 'changed' pages got a new
+    text, 'write' pages were saved, 'skip-noop' and 'skip-prefilter' pages
+    were skipped.
+    """
+
+    def put_current(self, new_text: str, *args, **kwargs) -> bool:
+        if new_text.rstrip() == self.current_page.text.rstrip():
+            # what userPut would find only after building the summary
+            self.counter['skip-noop'] += 1
+            pywikibot.debug(f'No changes were needed on {self.current_page}')
+            return False
+        self.counter['changed'] += 1
+        return super().put_current(new_text, *args, **kwargs)
+
+    def teardown(self) -> None:
+        counter = self.counter
+        total = counter['read'] + counter['skip']
+        pywikibot.info(
+            f"{total} pages: {counter['read']} parsed, "
+            f"{counter['changed']} changed, {counter['write']} saved, "
+            f"{counter['skip-noop']} skipped as no-op, "
+            f"{counter['skip-prefilter']} skipped by prefilter")
+        super().teardown()
+
+
+class PrefilterBot(CountingBot):
+
+    """Mixin skipping pages whose text contains none of ``prefilter``.
+
+    Put it in the bases of a CurrentPageBot subclass, before the pywikibot
+    classes.
+    """
+
+    # strings, any of which a page must contain to be treated
+    prefilter: tuple[str, ...] = ()
+
+    def wanted(self, text: str) -> bool:
+        """Tell whether *text* passes the prefilter of the bot."""
+        if not self.prefilter:
+            return True
+        return compile_prefilter(tuple(self.prefilter)).search(text) is not None
+
+    def skip_page(self, page) -> bool:
+        if super().skip_page(page):
+            return True
+        if not self.wanted(page.text):
+            pywikibot.debug(f'{page} has none of {self.prefilter}, skipped')
+            self.counter['skip-prefilter'] += 1
+            return True
+        return False
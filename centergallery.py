@@ -9,6 +9,8 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
 import wikitextparser as wtp
 import re
 import difflib
@@ -19,6 +21,7 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -41,6 +44,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('<gallery',)
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -117,6 +121,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -131,9 +137,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
@@ -8,11 +8,14 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
 import wikitextparser as wtp
 
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 class BasicBot(
+    PrefilterBot,
     SingleSiteBot,
     ConfigParserBot,
     ExistingPageBot,
@@ -20,6 +23,7 @@ class BasicBot(
 ):
     use_redirects = False
     summary_key = 'basic-changing'
+    prefilter = ('media notes', 'media_notes', 'album-notes')  # cite av media notes, cite album-notes
     update_options = {
         'replace': False,
         'summary': "[[ВП:ЗДБ#Заміна параметрів в Cite AV media notes|Заміна параметрів у шаблоні Cite AV media notes]]",
@@ -83,6 +87,8 @@ def main(*args: str) -> None:
     local_args = pywikibot.handle_args(args)
     gen_factory = pagegenerators.GeneratorFactory()
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
     for arg in local_args:
         arg, _, value = arg.partition(':')
         opt = arg[1:]
@@ -93,7 +99,9 @@ def main(*args: str) -> None:
                 options[opt] = value
         else:
             options[opt] = True
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
         BasicBot(generator=gen, **options).run()
 
@@ -9,16 +9,151 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
+import xmldump
+from botbase import PrefilterBot
+from pagepool import TransformPoolBot
 import re
-import difflib
+import time
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
+# hex colour (without #) -> Codex design token
+CODEX_COLORS = {"eaecf0": "background-color-neutral",
+    "202122": "color-base",
+    "404244": "color-base--hover",
+    "101418": "color-emphasized",
+    "54595d": "color-subtle",
+    "72777d": "color-placeholder",
+    "a2a9b1": "color-disabled",
+    "ffffff": "background-color-base",
+    "3366cc": "color-progressive",
+    "233566": "color-progressive--active",
+    "bf3c2c": "color-destructive",
+    "9f3526": "color-destructive--hover",
+    "612419": "color-destructive--active",
+    "6a60b0": "color-visited",
+    "534fa3": "color-visited--hover",
+    "353262": "color-visited--active",
+    "9f5555": "color-destructive--visited",
+    "854848": "color-destructive--visited--hover",
+    "512e2e": "color-destructive--visited--active",
+    "886425": "color-warning",
+    "177860": "color-success",
+    "f54739": "color-icon-error",
+    "ab7f2a": "color-icon-warning",
+    "099979": "color-icon-success",
+    "006400": "color-content-added",
+    "8b0000": "color-content-removed",
+    "eaecf0": "background-color-neutral",
+    "f8f9fa": "background-color-neutral-subtle",
+    "dadde3": "background-color-interactive--hover",
+    "c8ccd1": "background-color-interactive--active",
+    "d74032": "background-color-error--hover",        
+    "ffe9e5": "background-color-error-subtle",
+    "ffdad3": "background-color-error-subtle--hover",
+    "ffc8bd": "background-color-error-subtle--active",
+    "fdf2d5": "background-color-warning-subtle",
+    "dff2eb": "background-color-success-subtle",
+    "a3d3ff": "background-color-content-added",
+    "ffe49c": "background-color-content-removed",
+    "eeeeff": "ukwiki-background-color-paleblue",
+    "ffffee": "ukwiki-background-color-paleyellow",
+    "ccccff": "ukwiki-background-color-lavanderblue",
+    "ffeecc": "ukwiki-background-color-paleorange",
+    "f2f2f2": "ukwiki-background-color-midgray",
+}
+
+
+# six-digit hex colour, not already inside var(..., #colour)
+HEX_COLOR = re.compile(r'#([0-9a-f]{6})(?![0-9a-f)])', re.IGNORECASE)
+COLOR_VARS = {color: f"var(--{token}, #{color})"
+              for color, token in CODEX_COLORS.items()}
+# CSS in wikitext: the value of a style attribute (HTML and table markup) or
+# of a template parameter named *style (titlestyle=, header_style=...), quoted
+# or not, from its start up to a position on the same line; lowercase text
+STYLE_VALUE = re.compile(r"""style\s*=\s*(?:"[^"\n]*|'[^'\n]*|[^|{}<>"'\n]*)""")
+
+
+def _in_style(lowered: str, pos: int) -> bool:
+    """Tell whether *pos* is inside a style value of the lowercased text."""
+    line_start = lowered.rfind('\n', 0, pos) + 1
+    start = lowered.rfind('style', line_start, pos)
+    while start >= 0:
+        if STYLE_VALUE.fullmatch(lowered, start, pos):
+            return True
+        start = lowered.rfind('style', line_start, start)
+    return False
+
+
+def replace_colors(text: str) -> str:
+    """Replace hex colours in CSS with variables of Codex design tokens.
+
+    All colours are found in one scan and looked up in :data:`COLOR_VARS`;
+    only the few known ones have their context checked, and colours outside
+    style values (bgcolor=, links, plain text) are kept.
+    """
+    if '#' not in text:
+        return text
+    lowered = None
+
+    def replace(match: re.Match) -> str:
+        nonlocal lowered
+        var = COLOR_VARS.get(match[1].lower())
+        if var is None:
+            return match[0]
+        if lowered is None:
+            lowered = text.lower()
+        return var if _in_style(lowered, match.start()) else match[0]
+
+    return HEX_COLOR.sub(replace, text)
+
+
+def replace_colors_per_color(text: str) -> str:
+    """Previous implementation: one re.sub over the whole page per colour.
+
+    Kept for :func:`benchmark` only.
+    """
+    new_text = text
+    for var in CODEX_COLORS.keys():
+        regex = r"#" + var + r"(?!\))" # no closing bracket on the end
+        replacement = f"var(--{CODEX_COLORS[var]}, #{var})"
+        new_text = re.sub(regex, replacement, new_text, flags=re.IGNORECASE)
+    return new_text
+
+
+def benchmark(generator, rounds: int = 5) -> None:
+    """Time both implementations on the texts of *generator* pages.
+
+    Nothing is saved. Pages where the results differ are listed: they have
+    colours outside CSS, which only the old implementation replaced.
+    """
+    texts = []
+    for page in generator:
+        try:
+            texts.append((page.title(), page.text))
+        except pywikibot.exceptions.Error:
+            continue
+    size = sum(len(text) for _, text in texts)
+    pywikibot.info(f'{len(texts)} pages, {size} characters, {rounds} rounds')
+    for function in (replace_colors_per_color, replace_colors):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for _, text in texts:
+                function(text)
+        elapsed = time.perf_counter() - start
+        pywikibot.info(f'{function.__name__}: {elapsed / rounds:.3f} s per '
+                       f'round, {size * rounds / elapsed / 1e6:.1f} MB/s')
+    for title, text in texts:
+        if replace_colors(text) != replace_colors_per_color(text):
+            pywikibot.info(f'Different result: {title}')
+
+
 class BasicBot(
+    TransformPoolBot,  # -workers:N replaces colours in N processes
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -41,75 +176,17 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('style',)  # colours are replaced in style values only
 
     update_options = {
         'replace': False,  # delete old text and write the new text
         'summary': "Підставлення [[:wmdoc:codex/latest/design-tokens/color.html|CSS-змінних Codex]]",  # your own bot summary
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the page
+        'workers': 0,  # number of worker processes for the replacement
     }
 
-    def treat_page(self) -> None:
-        text = self.current_page.text
-        parsed = wtp.parse(text)
-        #templates = parsed.templates
-        
-        vars = {"eaecf0": "background-color-neutral",
-        "202122": "color-base",
-        "404244": "color-base--hover",
-        "101418": "color-emphasized",
-        "54595d": "color-subtle",
-        "72777d": "color-placeholder",
-        "a2a9b1": "color-disabled",
-        "ffffff": "background-color-base",
-        "3366cc": "color-progressive",
-        "233566": "color-progressive--active",
-        "bf3c2c": "color-destructive",
-        "9f3526": "color-destructive--hover",
-        "612419": "color-destructive--active",
-        "6a60b0": "color-visited",
-        "534fa3": "color-visited--hover",
-        "353262": "color-visited--active",
-        "9f5555": "color-destructive--visited",
-        "854848": "color-destructive--visited--hover",
-        "512e2e": "color-destructive--visited--active",
-        "886425": "color-warning",
-        "177860": "color-success",
-        "f54739": "color-icon-error",
-        "ab7f2a": "color-icon-warning",
-        "099979": "color-icon-success",
-        "006400": "color-content-added",
-        "8b0000": "color-content-removed",
-        "eaecf0": "background-color-neutral",
-        "f8f9fa": "background-color-neutral-subtle",
-        "dadde3": "background-color-interactive--hover",
-        "c8ccd1": "background-color-interactive--active",
-        "d74032": "background-color-error--hover",        
-        "ffe9e5": "background-color-error-subtle",
-        "ffdad3": "background-color-error-subtle--hover",
-        "ffc8bd": "background-color-error-subtle--active",
-        "fdf2d5": "background-color-warning-subtle",
-        "dff2eb": "background-color-success-subtle",
-        "a3d3ff": "background-color-content-added",
-        "ffe49c": "background-color-content-removed",
-        "eeeeff": "ukwiki-background-color-paleblue",
-        "ffffee": "ukwiki-background-color-paleyellow",
-        "ccccff": "ukwiki-background-color-lavanderblue",
-        "ffeecc": "ukwiki-background-color-paleorange",
-        "f2f2f2": "ukwiki-background-color-midgray",
-        }
-        
-        new_text = text
-        for var in vars.keys():
-            regex = r"#" + var + r"(?!\))" # no closing bracket on the end
-            replacement = f"var(--{vars[var]}, #{var})"
-            new_text = re.sub(regex, replacement, new_text, flags=re.IGNORECASE)
-
-        # Write changes back to the page text
-        if new_text != text:
-            self.put_current(new_text, summary=self.opt.summary)
-        else:
-            print("No changes made.")
+    transform = staticmethod(replace_colors)
 
 def main(*args: str) -> None:
     """
@@ -130,23 +207,31 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary', 'text'):
+        if option in ('summary', 'text', 'workers'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'benchmark':
+            options[option] = int(value or 5)  # rounds
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    # -benchmark[:rounds] only times the colour replacement on the pages
+    if 'benchmark' in options and gen:
+        benchmark(gen, options.pop('benchmark'))
+        return
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
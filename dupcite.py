@@ -9,7 +9,10 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
+import xmldump
+from botbase import PrefilterBot
+from editbuffer import EditBuffer
+from refindex import RefIndex
 import re
 import difflib
 
@@ -19,6 +22,7 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -30,6 +34,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('<ref', '{{r')  # named refs, also {{r}}
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -44,60 +49,29 @@ class BasicBot(
         text = self.current_page.text
         summary = self.opt.summary
 
-        parsed = wtp.parse(text)
-        tags = parsed.get_tags(name="ref")
-        tags_dict = {} # only ref tags
-        empty_tags = {} # all tags; name (str): stringified tag/template (str)
-
-        # Handle <ref> tags
-        for tag in tags:
-            if "name" in tag.attrs:
-                #print("Tag: " + tag.string)
-                name = tag.attrs["name"].replace("/", "")
-                
-                # Only update tags_dict if the tag's contents are not empty or not already in tags_dict
-                if name not in tags_dict or len(tags_dict[name].contents) == 0:
-                    if len(tag.contents) == 0:
-                        empty_tags[name] = str(tag)
-                        #print("added to empty")
-                    tags_dict[name] = tag
-                    #print("added to tags_dict")
-                
-                # Remove from empty_tags if we now have a tag with contents
-                if name in empty_tags and len(tag.contents) != 0:
-                    empty_tags.pop(name)
-                    #print("removed from empty")
-
-        # Handle {{R}} templates
-        r_templates = parsed.templates
-        empty_rs = {}
-        for template in r_templates:
-            if template.name.strip().lower() == 'bots' or template.name.strip().lower() == 'nobots': return None # don't do anything if the page is exempt
-            if template.name.strip().lower() == 'r' and template.arguments:
-                #print("R: " + template.string)
-                name = template.arguments[0].value
-                #print(name)
-                empty_rs[name] = template
-                if name not in tags_dict:
-                    empty_tags[name] = str(template)
-                    #print("added to empty")
+        index = RefIndex(text)
+        if index.exempt: return None # don't do anything if the page is exempt
+        # name (str): first tag/template that uses the name (RefSpan)
+        empty_tags = index.missing()
+        edits = EditBuffer(text)
 
         if len(empty_tags):
             #print(empty_tags)
-            #print(tags_dict)
             
             stop_search = False
             for key in empty_tags.keys():
                 if stop_search: break
-                if key[:-1] in tags_dict:
-                    print(f'Found content for {key}: {tags_dict[key[:-1]].string}')
+                entry = index.names.get(key[:-1])
+                if entry is not None and entry.has_tags:
+                    print(f'Found content for {key}: {index.string(entry.definition or entry.reuses[0])}')
                     print("Press y to accept replacement, n to decline, s to stop search")
                     
                     while True:
                         press_y = input().lower()
                         if press_y == "y":
                             new_ref = f'<ref name="{key[:-1]}"/>'
-                            text = text.replace(empty_tags[key], new_ref, 1)
+                            span = empty_tags[key]
+                            edits.replace(span.start, span.end, new_ref)
                             break
                         if press_y == "n":
                             break
@@ -105,6 +79,7 @@ class BasicBot(
                             stop_search = True
                             break
 
+        text = edits.apply()
         self.put_current(text, summary=summary)
 
 
@@ -127,6 +102,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -141,9 +118,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
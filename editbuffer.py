@@ -0,0 +1,111 @@
+"""
+Batch application of span-based edits to a page text.
+
+Bots used to rewrite the page with ``text = text.replace(old, new)`` once per
+match, which rescans and copies the whole article every time and also hits
+identical substrings elsewhere on the page. Here edits are collected as
+(start, end, replacement) against the original text, usually taken from the
+``span`` of wikitextparser objects, and the new text is built in one pass.
+
+Usage::
+
+    edits = EditBuffer(text)
+    for tag in parsed.get_tags(name="strike"):
+        edits.retag(tag, '<s>', '</s>')
+    text = edits.apply()
+
+Spans are only valid for the parse they come from, so the parsed tree must
+not be mutated (``template.name = ...``, ``set_arg``) before its spans are
+read.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+
+
+class OverlappingEditError(ValueError):
+
+    """Raised when a new edit intersects an already collected one."""
+
+
+class EditBuffer:
+
+    """Collect non-overlapping edits against *text* and apply them at once.
+
+    :param text: original text all spans refer to
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self._keys: list[tuple[int, int]] = []  # sorted (start, end)
+        self._new: list[str] = []  # replacement for the same index
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def replace(self, start: int, end: int, new: str) -> None:
+        """Replace ``text[start:end]`` with *new*.
+
+        Zero-width edits (``start == end``) insert text; several insertions at
+        the same position are applied in the order they were added.
+
+        :raises OverlappingEditError: the span intersects another edit
+        :raises ValueError: the span is outside the text
+        """
+        if not 0 <= start <= end <= len(self.text):
+            raise ValueError(f'Invalid span ({start}, {end}) for text of '
+                             f'length {len(self.text)}')
+        key = (start, end)
+        i = bisect_right(self._keys, key)
+        if i and self._keys[i - 1] == key and start != end:
+            if self._new[i - 1] == new:
+                return  # the same edit collected twice
+            raise OverlappingEditError(
+                f'Conflicting edits for span ({start}, {end})')
+        for j in (i - 1, i):
+            if 0 <= j < len(self._keys):
+                other_start, other_end = self._keys[j]
+                if start < other_end and other_start < end:
+                    raise OverlappingEditError(
+                        f'Edit ({start}, {end}) overlaps '
+                        f'({other_start}, {other_end})')
+        self._keys.insert(i, key)
+        self._new.insert(i, new)
+
+    def replace_node(self, node, new: str) -> None:
+        """Replace a wikitextparser object (template, tag, link...)."""
+        start, end = node.span
+        self.replace(start, end, new)
+
+    def remove_node(self, node) -> None:
+        """Remove a wikitextparser object from the text."""
+        self.replace_node(node, '')
+
+    def retag(self, tag, opening: str, closing: str) -> None:
+        """Replace only the opening and closing parts of a wikitextparser tag.
+
+        The contents stay in place, so nested tags of the same kind can be
+        rewritten in the same batch without overlapping.
+        """
+        start, end = tag.span
+        contents_start, contents_end = tag.parsed_contents.span
+        if not start <= contents_start <= contents_end <= end:
+            # self-closing tag, there are no contents to keep
+            self.replace(start, end, opening + closing)
+            return
+        self.replace(start, contents_start, opening)
+        self.replace(contents_end, end, closing)
+
+    def apply(self) -> str:
+        """Return the text with all collected edits applied."""
+        if not self._keys:
+            return self.text
+        text = self.text
+        parts = []
+        pos = 0
+        for (start, end), new in zip(self._keys, self._new):
+            parts.append(text[pos:start])
+            parts.append(new)
+            pos = end
+        parts.append(text[pos:])
+        return ''.join(parts)
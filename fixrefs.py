@@ -9,7 +9,10 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
+import xmldump
+from botbase import PrefilterBot
+from refindex import RefIndex
+from editbuffer import EditBuffer
 import re
 import difflib
 
@@ -19,6 +22,7 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -41,6 +45,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('<ref',)
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -65,53 +70,51 @@ class BasicBot(
         # Use your own text or use the default 'Test'
         
         print(self.current_page.extract(lines=2))
-        parsed = wtp.parse(text)
-        
-        for template in parsed.templates:
-            if template.name.strip().lower() == 'bots' or template.name.strip().lower() == 'nobots': return None # don't do anything if the page is exempt
-
-        
-        tags = parsed.get_tags(name="ref")
-        tags_dict = {}
-        for tag in tags:
-            if "name" in tag.attrs:
-                if tag.attrs["name"] in tags_dict:
-                    existing_tag = tags_dict[tag.attrs["name"]]
-                    # Only trigger conflict resolution if both tags are non-empty
-                    if len(tag.contents) == 0 or len(existing_tag.contents) == 0:
-                        continue
-                    if tag.contents == existing_tag.contents:
-                        continue
-                    print("Tag conflict!")
-                    tag1 = existing_tag
-                    tag2 = tag
-                    print(f'Tag 1:\n {tag1}')
-                    print(f'Tag 2:\n {tag2}')
-                    
-                    l1 = tag1.contents
-                    l2 = tag2.contents
-                    
-                    print("Pick one: (3 - skip, 4 - diff)")
-                    
-                    tag_chosen = "0"
-                    while tag_chosen not in ["1", "2", "3", "4"]:
-                        tag_chosen = input()
-                        if tag_chosen == "1":
-                            text = text.replace(f'>{l2}</ref', '/')
-                        elif tag_chosen == "2":
-                            text = text.replace(f'>{l1}</ref', '/')
-                            tags_dict[tag1.attrs["name"]] = tag2
-                        elif tag_chosen == "3":
-                            break
-                        elif tag_chosen == "4":
-                            difference = difflib.Differ()
-                            for line in difference.compare(l1.splitlines(keepends=True), l2.splitlines(keepends=True)):
-                                print(" ")
-                                print(line, end="")
-                else:
-                    # Only add non-empty tags to the dictionary
-                    if len(tag.contents) > 0:
-                        tags_dict[tag.attrs["name"]] = tag
+        index = RefIndex(text)
+        if index.exempt: return None # don't do anything if the page is exempt
+
+        edits = EditBuffer(text)
+        collapsed = set()
+
+        def collapse(entry, contents):
+            # <ref name="x">contents</ref> -> <ref name="x"/> for every such tag of this name
+            for dup in entry.definitions:
+                if dup not in collapsed and index.contents(dup) == contents:
+                    collapsed.add(dup)
+                    edits.replace(dup.body_start - 1, dup.end, '/>')
+
+        for entry in index.names.values():
+            # Only trigger conflict resolution if both tags are non-empty
+            existing_tag = entry.definition
+            for tag in entry.definitions[1:]:
+                if tag in collapsed:
+                    continue
+                l1 = index.contents(existing_tag)
+                l2 = index.contents(tag)
+                if l1 == l2:
+                    continue
+                print("Tag conflict!")
+                print(f'Tag 1:\n {index.string(existing_tag)}')
+                print(f'Tag 2:\n {index.string(tag)}')
+
+                print("Pick one: (3 - skip, 4 - diff)")
+
+                tag_chosen = "0"
+                while tag_chosen not in ["1", "2", "3", "4"]:
+                    tag_chosen = input()
+                    if tag_chosen == "1":
+                        collapse(entry, l2)
+                    elif tag_chosen == "2":
+                        collapse(entry, l1)
+                        existing_tag = tag
+                    elif tag_chosen == "3":
+                        break
+                    elif tag_chosen == "4":
+                        difference = difflib.Differ()
+                        for line in difference.compare(l1.splitlines(keepends=True), l2.splitlines(keepends=True)):
+                            print(" ")
+                            print(line, end="")
+        text = edits.apply()
          
         # if summary option is None, it takes the default i18n summary from
         # i18n subdirectory with summary_key as summary key.
@@ -137,6 +140,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -151,9 +156,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
@@ -9,6 +9,8 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
 import wikitextparser as wtp
 
 # This is required for the text that is shown when you run this script
@@ -32,6 +34,7 @@ TEMPLATE_NAMES = [
 ARTICLE_PARAM_ALIASES = ["Стаття", "стаття", "Article"]
 
 class BasicBot(
+    PrefilterBot,
     SingleSiteBot,
     ConfigParserBot,
     ExistingPageBot,
@@ -40,6 +43,7 @@ class BasicBot(
 
     use_redirects = False
     summary_key = 'basic-changing'
+    prefilter = tuple(TEMPLATE_NAMES)  # checked before the file usage requests
 
     update_options = {
         'replace': False,
@@ -158,6 +162,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -172,9 +178,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
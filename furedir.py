@@ -6,7 +6,10 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
 import wikitextparser as wtp
+from editbuffer import EditBuffer
 
 # List of template names (without the "Шаблон:" prefix) that use the "Стаття" parameter.
 TEMPLATE_NAMES = [
@@ -25,6 +28,7 @@ TEMPLATE_NAMES = [
 ARTICLE_PARAM_ALIASES = ["Стаття", "стаття", "Article"]
 
 class UpdateRedirectBot(
+    PrefilterBot,
     SingleSiteBot,
     ConfigParserBot,
     ExistingPageBot,
@@ -32,6 +36,7 @@ class UpdateRedirectBot(
 ):
     
     summary_key = 'basic-changing'
+    prefilter = tuple(TEMPLATE_NAMES)
     use_redirects = False
     
     update_options = {
@@ -62,13 +67,15 @@ class UpdateRedirectBot(
                             article_page = pywikibot.Page(self.site, current_val)
                             #print(f"article_page.exists(): {article_page.exists()}, article_page.isRedirectPage(): {article_page.isRedirectPage()}")
                             if article_page.exists() and article_page.isRedirectPage():
-                                old_template = template.string
+                                edits = EditBuffer(text)
+                                old_span = template.span # set_arg below changes the span
                                 target_page = article_page.getRedirectTarget()
                                 new_title = target_page.title()+"\n"
                                 #print(f"Updating parameter '{alias}': {current_val} -> {new_title}")
                                 template.set_arg(alias, new_title)
                                 print(f"Saving page: {page.title()}")
-                                text = text.replace(old_template, template.string)
+                                edits.replace(*old_span, template.string)
+                                text = edits.apply()
                                 self.current_page.put(text, summary=self.opt.summary)
                                 return None
                         break  # Stop after handling one of the aliases
@@ -94,6 +101,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -108,9 +117,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
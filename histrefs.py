@@ -9,7 +9,11 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
+import xmldump
+from botbase import PrefilterBot
+from editbuffer import EditBuffer
+from refhistory import RefHistory
+from refindex import RefIndex
 import re
 import difflib
 
@@ -19,6 +23,7 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -30,6 +35,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('<ref', '{{r')  # named refs, also {{r}}
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -37,6 +43,7 @@ class BasicBot(
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the 
         'tlang': 'en',
+        'bisect': False,  # find each lost ref by bisection over the history
     }
 
     def treat_page(self) -> None:
@@ -44,68 +51,30 @@ class BasicBot(
         text = self.current_page.text    
         summary = "Підстановка цитувань з попередньої версії статті"
         
-        parsed = wtp.parse(text)
-        tags = parsed.get_tags(name="ref")
-        tags_dict = {} # only ref tags
-        empty_tags = {} # all tags; name (str): stringified tag/template (str)
-        
-        # Handle <ref> tags
-        for tag in tags:
-            if "name" in tag.attrs:
-                name = tag.attrs["name"].replace("/", "")
-                
-                # Only update tags_dict if the tag's contents are not empty or not already in tags_dict
-                if name not in tags_dict or len(tags_dict[name].contents) == 0:
-                    if len(tag.contents) == 0:
-                        empty_tags[name] = str(tag)
-                    tags_dict[name] = tag
-                
-                # Remove from empty_tags if we now have a tag with contents
-                if name in empty_tags and len(tag.contents) != 0:
-                    empty_tags.pop(name)
-
-        # Handle {{R}} templates
-        r_templates = parsed.templates
-        empty_rs = {}
-        for template in r_templates:
-            if template.name.strip().lower() == 'r' and template.arguments:
-                name = template.arguments[0].value
-                empty_rs[name] = template
-                if name not in tags_dict:
-                    empty_tags[name] = str(template)
+        index = RefIndex(text)
+        if index.exempt: return None # don't do anything if the page is exempt
+        # name (str): first tag/template that uses the name (RefSpan)
+        empty_tags = index.missing()
+        edits = EditBuffer(text)
 
         if len(empty_tags):
-            print(empty_tags)
+            print(list(empty_tags))
             tags_replaced = 0
             stop_search = False
             revs_taken = {}
 
-            for revision in self.current_page.revisions(content=True):
-                
+            # only revisions that define a still missing name come back
+            history = RefHistory(self.current_page)
+            if self.opt.bisect:
+                candidates = history.bisect(empty_tags)
+            else:
+                candidates = history.scan(empty_tags)
+            for revision, tags_dict in candidates:
+
                 if stop_search:
                     break
-                try:
-                    print(f'Looking through {revision.comment} by {revision.user}')
-                    
-                    content = revision.text
-                    parsed_content = wtp.parse(content)
-                except Exception as e:
-                    print(e)
-                    print("-" * 80)
-                    print("Content")
-                    print("-" * 80)
-                    print(content)
-                    print("-" * 80)
-                    
-                parsed_tags = parsed_content.get_tags(name="ref")
-
-                tags_dict = {}
-                for tag in parsed_tags:
-                    if "name" in tag.attrs:
-                        if len(tag.contents) == 0:
-                            continue
-                        tags_dict[tag.attrs["name"]] = tag
-                
+                print(f'Looking through {revision.comment} by {revision.user}')
+
                 for key, value in tags_dict.items():
                     if key in empty_tags:
                         print(f'Found content for {key}: {value}')
@@ -114,8 +83,9 @@ class BasicBot(
                         while True:
                             press_y = input().lower()
                             if press_y == "y":
-                                new_ref = value.string
-                                text = text.replace(empty_tags[key], new_ref, 1)
+                                new_ref = value
+                                span = empty_tags[key]
+                                edits.replace(span.start, span.end, new_ref)
                                 del empty_tags[key]
                                 revs_taken[str(revision.revid)] = str(revision.user) # for edit summary
                                 break
@@ -132,6 +102,7 @@ class BasicBot(
                 summary += f"{user}: https://uk.wikipedia.org/w/index.php?title={self.current_page.title()}&oldid={id} ;"
             summary += ")"
 
+        text = edits.apply()
         self.put_current(text, summary=summary)
 
 
@@ -154,6 +125,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -168,9 +141,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
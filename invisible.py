@@ -0,0 +1,206 @@
+"""
+Cleanup of invisible and unusual whitespace characters in wikitext.
+
+zspace.py and zspace2.py did the same cleanup in two ways: a regex with a
+callback per character, and four regex passes per ref. Both parsed the
+whole page with mwparserfromhell to get at the refs. Here the 1:1 and
+delete cases are one ``str.translate`` table, and only zspace2's newline
+rule needs a regex. The places to clean are found in one scan of the
+page: ref contents with the ref index regex, cite templates and URLs with
+one wikitextparser parse, which is only done if those contexts are
+wanted.
+
+Usage::
+
+    normalizer = Normalizer(('refs', 'cite'), newlines=True)
+    text = normalizer.apply(text)
+
+Inside URLs (external links and ``url`` parameters) soft hyphens and
+zero-width characters are removed instead of turned into hyphens, which
+would break the link.
+"""
+from __future__ import annotations
+
+import re
+import time
+
+import mwparserfromhell
+import pywikibot
+import wikitextparser as wtp
+
+from refindex import ref_bodies
+
+SPACES = '\u00A0\u202F\u200A\u0009'  # -> space
+HYPHENS = '\u00AD'  # soft hyphen -> hyphen-minus
+INVISIBLE = '\u200B\u200C\u200D\uFEFF\uFFFD\u007F'  # -> removed
+
+TRANSLATION = str.maketrans({**dict.fromkeys(SPACES, ' '),
+                             **dict.fromkeys(HYPHENS, '-'),
+                             **dict.fromkeys(INVISIBLE, None)})
+URL_TRANSLATION = str.maketrans(
+    dict.fromkeys(HYPHENS + '\u200B\u200C\u200D\uFEFF'))
+# MediaWiki ends a URL at these, whatever wikitextparser says
+URL_END = re.compile('[\u00A0\u202F\u200A\u0009\uFFFD\u007F]')
+
+# stray newline: not followed by |, {, }, < or another newline
+STRAY_NEWLINE = re.compile(r'\n(?!\s*[\|{}<\n])')
+
+CONTEXTS = ('refs', 'cite', 'urls')
+# strings a page needs for the newline rule to apply in a context
+CONTEXT_LITERALS = {'refs': ('<ref',), 'cite': ('cite',), 'urls': ('//',)}
+
+
+def normalize(text: str, newlines: bool = False) -> str:
+    """Clean a piece of wikitext that is not a URL."""
+    if newlines:
+        text = STRAY_NEWLINE.sub(' ', text)
+    return text.translate(TRANSLATION)
+
+
+def _merge(spans: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Return the union of *spans* as sorted, disjoint spans."""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _url_span(text: str, start: int, end: int) -> tuple[int, int]:
+    """Return the span of the URL at *start*, up to *end* at most."""
+    match = URL_END.search(text, start, end)
+    return start, match.start() if match else end
+
+
+class Normalizer:
+
+    """Clean invisible characters in some contexts of a page.
+
+    :param contexts: any of :data:`CONTEXTS`: contents of ``<ref>`` tags,
+        cite templates, URLs
+    :param newlines: also turn stray newlines into spaces (not in URLs)
+    """
+
+    def __init__(self, contexts=('refs',), newlines: bool = False) -> None:
+        unknown = set(contexts) - set(CONTEXTS)
+        if unknown:
+            raise ValueError(f'Unknown contexts: {", ".join(sorted(unknown))}')
+        self.contexts = tuple(contexts)
+        self.newlines = newlines
+
+    @property
+    def prefilter(self) -> tuple[str, ...]:
+        """Strings one of which a page needs to be changed at all."""
+        if self.newlines:
+            return tuple(literal for context in self.contexts
+                         for literal in CONTEXT_LITERALS[context])
+        return tuple(SPACES + HYPHENS + INVISIBLE)
+
+    def spans(self, text: str) -> tuple[list, list]:
+        """Return the text spans and URL spans to clean, each merged."""
+        text_spans = []
+        url_spans = []
+        if 'refs' in self.contexts:
+            text_spans += ref_bodies(text)
+        if 'cite' in self.contexts or 'urls' in self.contexts:
+            parsed = wtp.parse(text)
+            templates = parsed.templates
+            if 'cite' in self.contexts:
+                text_spans += [
+                    template.span for template in templates
+                    if template.name.strip().lower().startswith('cite')]
+            if 'urls' in self.contexts:
+                for link in parsed.external_links:
+                    start = link.span[0] + link.in_brackets
+                    end = start + len(link.url)
+                    url_spans.append(_url_span(text, start, end))
+                for template in templates:
+                    for argument in template.arguments:
+                        if 'url' in argument.name.lower():
+                            end = argument.span[1]
+                            start = end - len(argument.value)
+                            url_spans.append(_url_span(text, start, end))
+        return _merge(text_spans), _merge(url_spans)
+
+    def apply(self, text: str) -> str:
+        """Return *text* with its contexts cleaned."""
+        text_spans, url_spans = self.spans(text)
+        if not text_spans and not url_spans:
+            return text
+        if self.newlines:
+            # newline -> space keeps the length, so all spans stay valid
+            chars = list(text)
+            for start, end in text_spans:
+                for match in STRAY_NEWLINE.finditer(text, start, end):
+                    chars[match.start()] = ' '
+            text = ''.join(chars)
+        # (start, end, table), URL spans take precedence over text spans
+        pieces = [(start, end, URL_TRANSLATION) for start, end in url_spans]
+        holes = iter(url_spans + [(len(text), len(text))])
+        hole = next(holes)
+        for start, end in text_spans:
+            while start < end:
+                while hole[1] <= start:
+                    hole = next(holes)
+                if hole[0] >= end:
+                    pieces.append((start, end, TRANSLATION))
+                    break
+                if hole[0] > start:
+                    pieces.append((start, hole[0], TRANSLATION))
+                start = hole[1]
+        out = []
+        position = 0
+        for start, end, table in sorted(pieces, key=lambda piece: piece[0]):
+            out.append(text[position:start])
+            out.append(text[start:end].translate(table))
+            position = end
+        out.append(text[position:])
+        return ''.join(out)
+
+
+def normalize_refs_mwparserfromhell(text: str, newlines: bool = False) -> str:
+    """Previous implementation: clean refs of a mwparserfromhell tree.
+
+    Kept for :func:`benchmark` only.
+    """
+    parsed = mwparserfromhell.parse(text)
+    for ref in parsed.filter_tags(
+            matches=lambda tag: tag.tag.lower() == 'ref'):
+        contents = str(ref.contents)
+        cleaned = normalize(contents, newlines)
+        if cleaned != contents:
+            ref.contents = cleaned
+    return str(parsed)
+
+
+def benchmark(generator, normalizer: Normalizer, rounds: int = 5) -> None:
+    """Time the cleanup of the *generator* pages, per page and per ref.
+
+    Nothing is saved. With only the refs context the previous
+    mwparserfromhell implementation is timed as well.
+    """
+    texts = []
+    for page in generator:
+        try:
+            texts.append(page.text)
+        except pywikibot.exceptions.Error:
+            continue
+    refs = sum(1 for text in texts for _ in ref_bodies(text))
+    pywikibot.info(f'{len(texts)} pages, {refs} refs, {rounds} rounds')
+    functions = [('Normalizer', normalizer.apply)]
+    if normalizer.contexts == ('refs',):
+        functions.insert(0, ('mwparserfromhell', lambda text:
+                             normalize_refs_mwparserfromhell(
+                                 text, normalizer.newlines)))
+    for name, function in functions:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in texts:
+                function(text)
+        elapsed = (time.perf_counter() - start) / rounds
+        per_ref = f', {elapsed / refs * 1e6:.1f} µs per ref' if refs else ''
+        pywikibot.info(f'{name}: {elapsed / max(len(texts), 1) * 1e3:.2f} ms '
+                       f'per page{per_ref}')
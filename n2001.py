@@ -9,24 +9,21 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
+import xmldump
+from botbase import PrefilterBot
+from editbuffer import EditBuffer
+from refindex import RefIndex
 import re
 import difflib
+import json
+import time
+from collections import deque
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
-def get_region_from_categories(page):
-    """
-    Визначає область, до якої належить населений пункт, на основі категорій статті, з урахуванням рекурсивного пошуку у батьківських категоріях.
-
-    :param page: Сторінка Вікіпедії про населений пункт.
-    :param regions_dict: Словник, що відображає категорії населених пунктів на області.
-    :return: Назва області або None, якщо область не знайдена.
-    """
-    
-    regions_dict = {
+REGIONS = {
     "Населені пункти Вінницької області": "Вінницька область",
     "Населені пункти Волинської області": "Волинська область",
     "Населені пункти Дніпропетровської області": "Дніпропетровська область",
@@ -51,28 +48,121 @@ def get_region_from_categories(page):
     "Населені пункти Черкаської області": "Черкаська область",
     "Населені пункти Чернівецької області": "Чернівецька область",
     "Населені пункти Чернігівської області": "Чернігівська область"
-    }
-    
-    
-    def check_category_recursively(category, visited):
-        if category.title(with_ns=False) in regions_dict:
-            return regions_dict[category.title(with_ns=False)]
+}
+
+REGION_MAP_FILE = 'n2001_regions.json'
+REGION_MAP_TTL = 30 * 24 * 60 * 60  # категорії перебудовуються нечасто
+
+
+def build_region_map(site) -> dict[str, str | None]:
+    """
+    Обходить дерево підкатегорій кожної категорії з REGIONS у ширину.
+
+    :param site: Вікі, на якій шукаються категорії.
+    :return: Назва категорії без простору назв -> область; None для
+        категорій, що належать до кількох областей.
+    """
+    region_map: dict[str, str | None] = dict(REGIONS)
+    queue = deque(REGIONS.items())
+    while queue:
+        title, region = queue.popleft()
+        category = pywikibot.Category(site, title)
+        for subcategory in category.subcategories():
+            sub_title = subcategory.title(with_ns=False)
+            if sub_title not in region_map:
+                region_map[sub_title] = region
+                queue.append((sub_title, region))
+            elif region_map[sub_title] not in (region, None) \
+                    and sub_title not in REGIONS:
+                region_map[sub_title] = None
+    return region_map
+
+
+class RegionMap:
+
+    """
+    Відображення категорія -> область, збережене на диску.
+
+    Карта будується один раз функцією build_region_map і читається з файлу,
+    доки їй не більше ttl секунд, тож для сторінки достатньо перевірити її
+    безпосередні категорії. Категорії, яких немає в карті (створені після
+    обходу), перевіряються вгору по дереву, як раніше, і одразу
+    записуються до файлу карти: зі знайденою областю або з None, якщо її
+    не знайдено, тож повторний запуск не обходить їх знову.
+    """
+
+    def __init__(self, site, filename: str = REGION_MAP_FILE,
+                 ttl: int = REGION_MAP_TTL) -> None:
+        self.site = site
+        self.filename = filename
+        self.changed = False
+        self.built = None
+        self.regions: dict[str, str | None] = {}
+        try:
+            with open(filename, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get('site') == str(site) \
+                and time.time() - data.get('built', 0) < ttl:
+            self.built = data['built']
+            self.regions = data['regions']
+        else:
+            pywikibot.info('Building the category -> region map...')
+            self.built = time.time()
+            self.regions = build_region_map(site)
+            self.changed = True
+            self.save()
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump({'site': str(self.site), 'built': self.built,
+                       'regions': self.regions}, f, ensure_ascii=False)
+        self.changed = False
+
+    def _climb(self, category, visited):
+        title = category.title(with_ns=False)
+        if title in self.regions:
+            return self.regions[title]
         visited.add(category)
         for parent_cat in category.categories():
             if parent_cat not in visited:
-                region = check_category_recursively(parent_cat, visited)
+                region = self._climb(parent_cat, visited)
                 if region:
                     return region
         return None
 
-    visited_categories = set()
-    for category in page.categories():
-        region = check_category_recursively(category, visited_categories)
-        if region:
-            return region
-    return None
+    def region(self, page) -> str | None:
+        """
+        Визначає область, до якої належить населений пункт, за категоріями статті.
+
+        :param page: Сторінка Вікіпедії про населений пункт.
+        :return: Назва області або None, якщо область не знайдена.
+        """
+        categories = list(page.categories())
+        for category in categories:
+            region = self.regions.get(category.title(with_ns=False))
+            if region:
+                return region
+
+        visited_categories = set()
+        region = None
+        for category in categories:
+            title = category.title(with_ns=False)
+            if title in self.regions:
+                continue  # ambiguous or climbed before without result
+            region = self._climb(category, visited_categories)
+            self.regions[title] = region  # None: no region above it
+            self.changed = True
+            if region:
+                break
+        self.save()
+        return region
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -95,6 +185,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('населення 2001 мова',)  # name of the restored ref
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -103,6 +194,13 @@ class BasicBot(
         'top': False,  # append text on top of the page
     }
 
+    region_map = None  # RegionMap, loaded when the first page needs it
+
+    def teardown(self) -> None:
+        if self.region_map is not None:
+            self.region_map.save()
+        super().teardown()
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
         text = self.current_page.text
@@ -119,35 +217,24 @@ class BasicBot(
         # Use your own text or use the default 'Test'
         
         print(self.current_page.extract(lines=2))
-        parsed = wtp.parse(text)
-        tags = parsed.get_tags(name="ref")
-        tags_dict = {} # only ref tags
-        empty_tags = {} # all tags; name (str): stringified tag/template (str)
-
-        # Handle <ref> tags
-        for tag in tags:
-            if "name" in tag.attrs:
-                name = tag.attrs["name"].replace("/", "")
-                
-                # Only update tags_dict if the tag's contents are not empty or not already in tags_dict
-                if name not in tags_dict or len(tags_dict[name].contents) == 0:
-                    if len(tag.contents) == 0:
-                        empty_tags[name] = str(tag)
-                    tags_dict[name] = tag
-                
-                # Remove from empty_tags if we now have a tag with contents
-                if name in empty_tags and len(tag.contents) != 0:
-                    empty_tags.pop(name)
+        index = RefIndex(text)
+        # name (str): first tag/template that uses the name (RefSpan)
+        empty_tags = index.missing()
+        edits = EditBuffer(text)
 
         if "населення 2001 мова" in empty_tags:
-            region = get_region_from_categories(self.current_page)
+            if self.region_map is None:
+                self.region_map = RegionMap(self.site)
+            region = self.region_map.region(self.current_page)
             if region == None:
                 print("region not found")
             else:
                 print(region)
-                print(empty_tags)
-                text = text.replace(empty_tags["населення 2001 мова"], '<ref name="населення 2001 мова">{{БД Держстату України|тип=2001 мова|регіон=' + region + '}}</ref>')
+                print(list(empty_tags))
+                span = empty_tags["населення 2001 мова"]
+                edits.replace(span.start, span.end, '<ref name="населення 2001 мова">{{БД Держстату України|тип=2001 мова|регіон=' + region + '}}</ref>')
                 
+        text = edits.apply()
         self.put_current(text, summary=self.opt.summary)
 
 def main(*args: str) -> None:
@@ -169,6 +256,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -183,9 +272,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
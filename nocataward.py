@@ -9,6 +9,8 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import CountingBot
 import wikitextparser as wtp
 import time
 
@@ -17,6 +19,7 @@ import time
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 class AwardTemplateBot(
+    CountingBot,
     SingleSiteBot,
     ConfigParserBot,
     ExistingPageBot,
@@ -158,6 +161,8 @@ def main(*args: str) -> None:
     local_args = pywikibot.handle_args(args)
     gen_factory = pagegenerators.GeneratorFactory()
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     for arg in local_args:
         arg, _, value = arg.partition(':')
@@ -169,7 +174,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
         bot = AwardTemplateBot(generator=gen, **options)
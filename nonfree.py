@@ -9,7 +9,10 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
 import wikitextparser as wtp
+from editbuffer import EditBuffer, OverlappingEditError
 import time
 
 # This is required for the text that is shown when you run this script
@@ -17,6 +20,7 @@ import time
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 class NonFreeImageRemoverBot(
+    PrefilterBot,
     SingleSiteBot,
     ConfigParserBot,
     ExistingPageBot,
@@ -28,6 +32,7 @@ class NonFreeImageRemoverBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'nonfree-image-removal'
+    prefilter = ('файл:', 'file:', 'зображення:')  # file links
 
     update_options = {
         'summary': "Видалення невільних зображень з статті ([[ВП:КДВ]])",  # your own bot summary
@@ -45,19 +50,22 @@ class NonFreeImageRemoverBot(
         text = self.current_page.text
         parsed = wtp.parse(text)
 
-        modified = False
+        edits = EditBuffer(text)
         for image in parsed.wikilinks:
             image_title = image.title.strip()
             #print(f"Processing image: {image_title}")
 
             if self.is_non_free_image(image_title):
                 # Substitute the image link with an empty string
-                text = text.replace(str(image), '')
+                try:
+                    edits.remove_node(image)
+                except OverlappingEditError:
+                    continue  # nested in an image link that is already removed
                 print(f"Removed non-free image {image_title} from page {self.current_page.title()}")
-                modified = True
 
         # Save changes if the text was modified
-        if modified:
+        if len(edits):
+            text = edits.apply()
             self.put_current(text, summary=self.opt.summary)
             print(f"Saved changes to page: {self.current_page.title()}")
         else:
@@ -104,6 +112,8 @@ def main(*args: str) -> None:
     local_args = pywikibot.handle_args(args)
     gen_factory = pagegenerators.GeneratorFactory()
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     for arg in local_args:
         arg, _, value = arg.partition(':')
@@ -115,7 +125,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
         bot = NonFreeImageRemoverBot(generator=gen, **options)
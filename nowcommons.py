@@ -1,12 +1,13 @@
 import pywikibot
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
-import requests
-from pywikibot.data.api import Request
+import json
 import os
+import time
 import sys
 import warnings
+from sha1index import Sha1Index
+import sha1index
 
 """
 Script to check for Commons duplicates in a list of files on Wikipedia
@@ -23,152 +24,551 @@ FILENAME = 'file_list.txt'                # File to store the list of filenames
 COMMONS_DUPLICATES_FILE = 'commons_duplicates.txt'  # File to store duplicates found on Commons
 WIKI_LANGUAGE = 'uk'                      # Wiki language, e.g., 'en', 'br', etc.
 WIKI_PROJECT = 'wikipedia'                # Wiki project, e.g., 'wikipedia'
-BATCH_SIZE = 500                          # Number of files to process in one batch
+BATCH_SIZE = 500                          # Number of files to list in one allimages request
+DUPLICATES_BATCH = 50                     # Titles per prop=duplicatefiles request
 REMOVE_PREFIX = 'Файл:'                  # Prefix to remove from file names during list creation
-
-# Asynchronous function to check if the file has a link to Commons on its page
-async def has_commons_link(session, page):
-    url = page.full_url()
+COMMONS_INDEX_FILE = 'commons_sha1.bin'   # SHA-1 index of all Commons files, see sha1index.py
+CHECKPOINT_FILE = 'nowcommons_checkpoint.json'  # Progress of an unfinished run
+WORKERS = 10                              # Most concurrent prop=duplicatefiles requests
+TARGET_LATENCY = 2.0                      # Seconds per request above which concurrency is lowered
+UNKNOWN_FILE = 'commons_unknown.txt'      # Files whose status could not be checked
+RETRY_ROUNDS = 3                          # Extra passes over unknown files at the end
+RETRY_DELAY = 30                          # Seconds before the first extra pass, doubled each time
+STATE_FILE = 'nowcommons_state.json'      # Start of the last complete run, for -incremental
+REPORTED_FILE = 'commons_reported.txt'    # Files already reported as duplicates
+COMMONS_API_URL = 'https://commons.wikimedia.org/w/api.php'
+
+# Error of a single API request; retry_after is the delay the server asked for
+class ApiError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def retry_after_header(response):
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                text = await response.text()
-                soup = BeautifulSoup(text, 'html.parser')
-                duplicates_list = soup.find('ul', {'class': 'mw-imagepage-duplicates'})
-                if duplicates_list:
-                    links = duplicates_list.find_all('a', class_='external')
-                    for link in links:
-                        href = link.get('href', '')
-                        if 'commons.wikimedia.org' in href:
-                            return True
-    except Exception as e:
-        print(f"Error fetching URL {url}: {e}", file=sys.stderr)
-    return False
-
-# Asynchronous function to process a batch of files
-async def process_batch(lines, start, batch_size, site):
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for i in range(start, min(start + batch_size, len(lines))):
-            file_title = lines[i].strip()  # No prefix added
-            page = pywikibot.FilePage(site, file_title)
-            tasks.append(has_commons_link(session, page))
-
-        results = await asyncio.gather(*tasks)
-
-        duplicate_count = 0
-        with open(COMMONS_DUPLICATES_FILE, 'a', encoding='utf-8') as commons_file:  # Append mode
-            for i, exists_on_commons in enumerate(results):
-                if exists_on_commons:
-                    # Output in the "# [[:File:<Foo.jpg>]]" format
-                    commons_file.write(f"# [[:File:{lines[start + i].strip()}]]\n")
-                    print(f"# [[:File:{lines[start + i].strip()}]]")
-                    duplicate_count += 1
-
-        return duplicate_count
-
-# Function to process the entire file list asynchronously
-async def process_file_list(filename, batch_size, site):
-    with open(filename, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
-    total_files = len(lines)
-    total_duplicates = 0
-    
-    for start in range(0, total_files, batch_size):
-        duplicates_in_batch = await process_batch(lines, start, batch_size, site)
-        total_duplicates += duplicates_in_batch
-        print(f"Checked {min(start + batch_size, total_files)} files")
-
-    # Append the total duplicates count to the file
-    with open(COMMONS_DUPLICATES_FILE, 'a', encoding='utf-8') as commons_file:
-        commons_file.write(f"\nTotal duplicates found: {total_duplicates}\n")
-
-    print(f"Total duplicates found: {total_duplicates}")
-
-# Function to fetch files in batches
-def fetch_files(site, start='!'):
-    all_files = []
-    last_file_name = None
-
+        return float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        return None
+
+# Delay asked for by an API error: the Retry-After header, or for a maxlag
+# error the lag the server reports
+def error_retry_after(response, error):
+    retry_after = retry_after_header(response)
+    if retry_after is None and error.get('code') == 'maxlag':
+        try:
+            retry_after = float(error.get('lag', ''))
+        except (TypeError, ValueError):
+            pass
+    return retry_after
+
+# Asynchronous function to find which of the given files have a duplicate on Commons.
+# prop=duplicatefiles compares SHA-1 hashes with the shared repository as well;
+# duplicates found there are marked as "shared". Raises ApiError if the
+# answer is not complete, nothing is guessed.
+async def commons_duplicates(session, api_url, titles):
+    params = {
+        'action': 'query',
+        'prop': 'duplicatefiles',
+        'titles': '|'.join(f'File:{title}' for title in titles),
+        'dflimit': 'max',
+        'maxlag': '5',
+        'format': 'json',
+        'formatversion': '2',
+    }
+    found = set()
+    while True:
+        async with session.post(api_url, data=params) as response:
+            if response.status != 200:
+                raise ApiError(f"HTTP {response.status}", retry_after_header(response))
+            result = await response.json()
+            if 'error' in result:
+                raise ApiError(result['error'].get('code'), error_retry_after(response, result['error']))
+        for page in result['query']['pages']:
+            duplicates = page.get('duplicatefiles', [])
+            if any(duplicate.get('shared') for duplicate in duplicates):
+                found.add(page['title'].split(':', 1)[1])
+        if 'continue' not in result:
+            break
+        params.update(result['continue'])
+    return found
+
+# Concurrency limit adjusted by AIMD: every fast successful request raises it
+# by 1/limit (about +1 per round of requests), a slow or failed one halves it,
+# at most once per TARGET_LATENCY. Retry-After stops all new requests until
+# the given time; retry_after is the delay asked for by the last failure.
+class AdaptiveLimit:
+    def __init__(self, maximum, initial=2):
+        self.maximum = maximum
+        self.limit = float(min(initial, maximum))
+        self.active = 0
+        self.resume_at = 0.0
+        self.retry_after = None
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, latency, ok, retry_after=None):
+        now = time.monotonic()
+        async with self.condition:
+            self.active -= 1
+            if ok and latency <= TARGET_LATENCY:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif now - self.last_decrease > TARGET_LATENCY:
+                self.limit = max(1.0, self.limit / 2)
+                self.last_decrease = now
+            if not ok:
+                self.retry_after = retry_after
+            if retry_after:
+                self.resume_at = max(self.resume_at, now + retry_after)
+            self.condition.notify_all()
+
+# Asynchronous function to check one chunk of titles within the limit.
+# Returns the titles with a Commons duplicate and the titles whose status is
+# unknown (the request failed); all others are not duplicates.
+async def check_chunk(session, api_url, titles, limit):
+    await limit.acquire()
+    started = time.monotonic()
+    try:
+        found = await commons_duplicates(session, api_url, titles)
+    except (ApiError, aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+        await limit.release(time.monotonic() - started, False, getattr(e, 'retry_after', None))
+        print(f"Error checking duplicates of {titles[0]}...: {e!r}")
+        return set(), set(titles)
+    await limit.release(time.monotonic() - started, True)
+    return found, set()
+
+# Asynchronous generator over all local files, one allimages response at a time.
+# Each response comes with the continuation that follows it, so that a run can
+# be resumed after any of them.
+async def iter_allimages(session, api_url, cont):
+    params = {
+        'action': 'query',
+        'list': 'allimages',
+        'aiprop': 'sha1',
+        'ailimit': str(BATCH_SIZE),
+        'format': 'json',
+        'formatversion': '2',
+    }
     while True:
-        request = Request(site, action='query', list='allimages', aifrom=start, ailimit='500')
-        result = request.submit()
-        files = result['query']['allimages']
+        async with session.get(api_url, params=dict(params, **cont)) as response:
+            response.raise_for_status()
+            result = await response.json()
+        files = [(file_info['title'].replace(REMOVE_PREFIX, ''), file_info['sha1'])
+                 for file_info in result['query']['allimages']]
+        cont = result.get('continue')
+        yield files, cont
+        if cont is None:
+            break
 
-        if not files:
+# Asynchronous function to check the files listed in UNKNOWN_FILE again, in a
+# few passes with shrinking chunks, after the delay the server asked for or
+# else a growing one. New duplicates are appended to commons_file
+# and files still unknown are left in UNKNOWN_FILE. Returns the new
+# duplicates.
+async def retry_unknown(session, api_url, limit, commons_file):
+    with open(UNKNOWN_FILE, 'r', encoding='utf-8') as f:
+        unknown = [line.rstrip('\n') for line in f if line.strip()]
+    all_found = []
+    for attempt in range(RETRY_ROUNDS):
+        if not unknown:
             break
+        delay = limit.retry_after
+        if delay is None:
+            delay = RETRY_DELAY * 2 ** attempt
+        print(f"Checking {len(unknown)} files with unknown status again in {delay} s")
+        await asyncio.sleep(delay)
+        # Smaller chunks each time, so that one bad title does not keep others unknown
+        size = max(1, DUPLICATES_BATCH >> (attempt + 1))
+        limit.retry_after = None
+        chunks = [unknown[i:i + size] for i in range(0, len(unknown), size)]
+        results = await asyncio.gather(*(check_chunk(session, api_url, chunk, limit) for chunk in chunks))
+        found = set().union(*(chunk_found for chunk_found, _ in results))
+        still_unknown = set().union(*(chunk_unknown for _, chunk_unknown in results))
+        for file_title in unknown:
+            if file_title in found:
+                commons_file.write(f"# [[:File:{file_title}]]\n")
+                print(f"# [[:File:{file_title}]]")
+                all_found.append(file_title)
+        commons_file.flush()
+        unknown = [file_title for file_title in unknown if file_title in still_unknown]
+        with open(UNKNOWN_FILE, 'w', encoding='utf-8') as f:
+            f.writelines(f"{file_title}\n" for file_title in unknown)
+    return all_found
+
+# Functions to keep the progress of a run: the continuation after the last
+# allimages response whose files are all written out, and the counters
+def load_checkpoint():
+    try:
+        with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(state):
+    with open(CHECKPOINT_FILE + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(CHECKPOINT_FILE + '.tmp', CHECKPOINT_FILE)
+
+# Asynchronous pipeline over all local files. allimages responses are read one
+# after another and split into chunks for prop=duplicatefiles, which a fixed
+# number of workers check on one shared session. The queue between them is
+# bounded, so only a few responses are in memory at a time. A response is
+# written out (to the file list and the duplicates file) once all its chunks
+# are checked, in the original order, and then the checkpoint moves past it.
+async def run_pipeline(site, check_duplicates=True):
+    api_url = f"{site.protocol()}://{site.hostname()}{site.apipath()}"
+    state = load_checkpoint()
+    if state is None:
+        state = {'continue': {}, 'offset': 0, 'duplicates': 0, 'started': time.time()}
+        # A new run starts with empty output files
+        open(FILENAME, 'w').close()
+        open(COMMONS_DUPLICATES_FILE, 'w').close()
+        open(UNKNOWN_FILE, 'w').close()
+    else:
+        print(f"Resuming after {state['offset']} files")
+
+    pages = {}  # number of response -> [files, continuation, chunks left, duplicates, unknown]
+    next_page = 0  # number of the next response to write out
+    queue = asyncio.Queue(maxsize=2 * WORKERS)
+
+    limit = AdaptiveLimit(WORKERS)
+
+    with open(FILENAME, 'a', encoding='utf-8') as list_file, \
+            open(COMMONS_DUPLICATES_FILE, 'a', encoding='utf-8') as commons_file, \
+            open(UNKNOWN_FILE, 'a', encoding='utf-8') as unknown_file:
+
+        def write_finished_pages():
+            nonlocal next_page
+            while next_page in pages and pages[next_page][2] == 0:
+                files, cont, _, found, unknown = pages.pop(next_page)
+                for file_title, sha1 in files:
+                    list_file.write(f"{file_title}\t{sha1}\n")
+                    if file_title in found:
+                        # Output in the "# [[:File:<Foo.jpg>]]" format
+                        commons_file.write(f"# [[:File:{file_title}]]\n")
+                        print(f"# [[:File:{file_title}]]")
+                    elif file_title in unknown:
+                        unknown_file.write(f"{file_title}\n")
+                list_file.flush()
+                commons_file.flush()
+                unknown_file.flush()
+                state['offset'] += len(files)
+                state['duplicates'] += len(found)
+                state['continue'] = cont  # None: the whole list is written
+                save_checkpoint(state)
+                print(f"Checked {state['offset']} files")
+                next_page += 1
+
+        async def worker(session):
+            while True:
+                number, titles = await queue.get()
+                try:
+                    found, unknown = await check_chunk(session, api_url, titles, limit)
+                    pages[number][3] |= found
+                    pages[number][4] |= unknown
+                    pages[number][2] -= 1
+                    write_finished_pages()
+                finally:
+                    queue.task_done()
+
+        async with aiohttp.ClientSession() as session:
+            workers = [asyncio.create_task(worker(session))
+                       for _ in range(WORKERS if check_duplicates else 0)]
+
+            # Workers only stop with an exception; then waiting for the queue
+            # would never end, so the exception is raised instead
+            async def unless_worker_fails(awaitable):
+                task = asyncio.ensure_future(awaitable)
+                await asyncio.wait([task, *workers], return_when=asyncio.FIRST_COMPLETED)
+                if not task.done():
+                    task.cancel()
+                    raise next(w.exception() for w in workers if w.done())
+                return task.result()
 
-        for file_info in files:
-            # Remove the prefix during file fetching
-            file_title = file_info['title'].replace(REMOVE_PREFIX, '')
-            all_files.append(file_title)
-            last_file_name = file_title
+            try:
+                number = 0
+                # continuation None: the list was finished before an interruption
+                if state['continue'] is not None:
+                    async for files, cont in iter_allimages(session, api_url, state['continue']):
+                        titles = [file_title for file_title, _ in files] if check_duplicates else []
+                        chunks = [titles[i:i + DUPLICATES_BATCH]
+                                  for i in range(0, len(titles), DUPLICATES_BATCH)]
+                        pages[number] = [files, cont, len(chunks), set(), set()]
+                        for chunk in chunks:
+                            await unless_worker_fails(queue.put((number, chunk)))
+                        if not chunks:
+                            write_finished_pages()
+                        number += 1
+            finally:
+                # Also after an error, let the workers finish what is queued,
+                # so that it still reaches the checkpoint
+                try:
+                    await unless_worker_fails(queue.join())
+                finally:
+                    for task in workers:
+                        task.cancel()
+
+            if pages:
+                raise RuntimeError(f"{len(pages)} allimages responses were not finished, "
+                                   f"run the script again to resume")
+
+            # Files whose status is unknown are checked again at the end
+            if check_duplicates:
+                unknown_file.flush()
+                state['duplicates'] += len(await retry_unknown(session, api_url, limit, commons_file))
+
+            # Compare with API-reported total
+            async with session.get(api_url, params={'action': 'query', 'meta': 'siteinfo',
+                                                    'siprop': 'statistics', 'format': 'json'}) as response:
+                total_files_reported = (await response.json())['query']['statistics']['images']
+
+        # Append the total duplicates count to the file
+        if check_duplicates:
+            commons_file.write(f"\nTotal duplicates found: {state['duplicates']}\n")
+            print(f"Total duplicates found: {state['duplicates']}")
+            with open(UNKNOWN_FILE, 'r', encoding='utf-8') as f:
+                unknown_count = sum(1 for line in f if line.strip())
+            if unknown_count:
+                print(f"Warning: {unknown_count} files could not be checked, see {UNKNOWN_FILE}")
+
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
 
-        print(f"Last file in batch: {last_file_name}")
+    print(f"Total files reported by API: {total_files_reported}")
+    print(f"Total files retrieved: {state['offset']}")
+    if state['offset'] != total_files_reported:
+        print("Warning: There is a discrepancy between the retrieved files and the total reported by the API.")
+    else:
+        print("Success! The number of retrieved files matches the total reported by the API.")
+    return state['started']
 
-        if len(files) < 500 or last_file_name == start:
+# Asynchronous generator over the items of an API list, following continuation
+async def iter_api_list(session, api_url, list_name, params):
+    params = dict(params, action='query', list=list_name, format='json', formatversion='2')
+    cont = {}
+    while True:
+        async with session.get(api_url, params=dict(params, **cont)) as response:
+            response.raise_for_status()
+            result = await response.json()
+        if 'error' in result:
+            raise ApiError(result['error'].get('code'), retry_after_header(response))
+        for item in result['query'][list_name]:
+            yield item
+        cont = result.get('continue')
+        if cont is None:
             break
-        else:
-            start = last_file_name
 
-    return all_files
+# Asynchronous function to get the SHA-1 of the given local files
+async def file_sha1s(session, api_url, titles):
+    sha1s = {}
+    for i in range(0, len(titles), DUPLICATES_BATCH):
+        params = {
+            'action': 'query',
+            'prop': 'imageinfo',
+            'iiprop': 'sha1',
+            'titles': '|'.join(f'File:{title}' for title in titles[i:i + DUPLICATES_BATCH]),
+            'format': 'json',
+            'formatversion': '2',
+        }
+        async with session.post(api_url, data=params) as response:
+            response.raise_for_status()
+            result = await response.json()
+        for page in result['query']['pages']:
+            if page.get('imageinfo'):
+                sha1s[page['title'].split(':', 1)[1]] = page['imageinfo'][0]['sha1']
+    return sha1s
+
+# Asynchronous function for -incremental: only files whose Commons duplicate
+# status may have changed since the last complete run are checked.
+# Those are local files uploaded or overwritten since then (local upload log)
+# and local files with the SHA-1 of a file uploaded to Commons since then
+# (Commons allimages sorted by time, matched against the file list).
+# Files left unknown by the previous run are checked again as well.
+# Files reported before are skipped; new duplicates are appended.
+async def run_incremental(site, since):
+    started = time.time()
+    api_url = f"{site.protocol()}://{site.hostname()}{site.apipath()}"
+    since = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(since - 600))  # some overlap
+    reported = load_reported()
+
+    local_sha1 = {}
+    with open(FILENAME, 'r', encoding='utf-8') as f:
+        for line in f:
+            file_title, _, sha1 = line.rstrip('\n').partition('\t')
+            local_sha1.setdefault(sha1, []).append(file_title)
+    try:
+        with open(UNKNOWN_FILE, 'r', encoding='utf-8') as f:
+            left_unknown = [line.rstrip('\n') for line in f if line.strip()]
+    except OSError:
+        left_unknown = []
 
-# Function to compare file list with API-reported total and save the file list
-def check_file_list(site):
-    all_files = fetch_files(site)
+    limit = AdaptiveLimit(WORKERS)
+    async with aiohttp.ClientSession() as session:
+        uploaded = []
+        async for event in iter_api_list(session, api_url, 'logevents', {
+                'letype': 'upload', 'lestart': since, 'ledir': 'newer',
+                'leprop': 'title', 'lelimit': 'max'}):
+            if 'title' in event:  # no title if the entry is hidden
+                uploaded.append(event['title'].split(':', 1)[1])
+        uploaded = list(dict.fromkeys(uploaded))
+
+        matched = []
+        async for file_info in iter_api_list(session, COMMONS_API_URL, 'allimages', {
+                'aisort': 'timestamp', 'aistart': since, 'aiprop': 'sha1', 'ailimit': 'max'}):
+            matched.extend(local_sha1.get(file_info['sha1'], ()))
+
+        titles = [file_title for file_title in dict.fromkeys(uploaded + matched + left_unknown)
+                  if file_title not in reported]
+        print(f"Files uploaded here since {since}: {len(uploaded)}, "
+              f"matching new Commons files: {len(matched)}, "
+              f"unknown before: {len(left_unknown)}, to check: {len(titles)}")
+
+        chunks = [titles[i:i + DUPLICATES_BATCH] for i in range(0, len(titles), DUPLICATES_BATCH)]
+        results = await asyncio.gather(*(check_chunk(session, api_url, chunk, limit) for chunk in chunks))
+        found = set().union(*(chunk_found for chunk_found, _ in results))
+        unknown = set().union(*(chunk_unknown for _, chunk_unknown in results))
+
+        with open(COMMONS_DUPLICATES_FILE, 'a', encoding='utf-8') as commons_file:
+            new_duplicates = [file_title for file_title in titles if file_title in found]
+            for file_title in new_duplicates:
+                commons_file.write(f"# [[:File:{file_title}]]\n")
+                print(f"# [[:File:{file_title}]]")
+            with open(UNKNOWN_FILE, 'w', encoding='utf-8') as f:
+                f.writelines(f"{file_title}\n" for file_title in titles if file_title in unknown)
+            new_duplicates += await retry_unknown(session, api_url, limit, commons_file)
+            commons_file.write(f"\nNew duplicates since {since}: {len(new_duplicates)}\n")
+        print(f"New duplicates since {since}: {len(new_duplicates)}")
+
+        # New local files go to the file list, so that later Commons uploads
+        # are matched against them too
+        sha1s = await file_sha1s(session, api_url, uploaded)
+        with open(FILENAME, 'a', encoding='utf-8') as list_file:
+            for file_title, sha1 in sha1s.items():
+                if file_title not in local_sha1.get(sha1, ()):
+                    list_file.write(f"{file_title}\t{sha1}\n")
+
+    return started
+
+# Functions to keep the state between runs for -incremental: the start of the
+# last complete run and the files already reported as duplicates
+def load_state():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    unique_files = list(set(all_files))  # Remove duplicates
+def save_state(state):
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
 
-    # Compare with API-reported total
-    api_url = f"https://{site.code}.{site.family.domain}/w/api.php?action=query&meta=siteinfo&siprop=statistics&format=json"
-    api_response = requests.get(api_url)
-    total_files_reported = api_response.json()['query']['statistics']['images']
-    print(f"Total files reported by API: {total_files_reported}")
-    print(f"Total unique files retrieved: {len(unique_files)}")
+def load_reported():
+    try:
+        with open(REPORTED_FILE, 'r', encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f}
+    except OSError:
+        return set()
+
+def record_reported(filename):
+    reported = load_reported()
+    with open(filename, 'r', encoding='utf-8') as f, \
+            open(REPORTED_FILE, 'a', encoding='utf-8') as reported_file:
+        for line in f:
+            if line.startswith('# [[:File:'):
+                file_title = line.strip()[len('# [[:File:'):-len(']]')]
+                if file_title not in reported:
+                    reported_file.write(f"{file_title}\n")
+                    reported.add(file_title)
+
+# Function to check the file list against the local SHA-1 index of Commons,
+# no request is made per file
+def process_file_list_offline(filename, index_file):
+    index = Sha1Index(index_file)
+    index_size = len(index)
+    total_files = 0
+    total_duplicates = 0
+    try:
+        with open(filename, 'r', encoding='utf-8') as f, \
+                open(COMMONS_DUPLICATES_FILE, 'a', encoding='utf-8') as commons_file:
+            for line in f:
+                file_title, _, sha1 = line.rstrip('\n').partition('\t')
+                total_files += 1
+                if not sha1:
+                    print(f"No SHA-1 for {file_title}, the file list is outdated")
+                elif sha1 in index:
+                    commons_file.write(f"# [[:File:{file_title}]]\n")
+                    print(f"# [[:File:{file_title}]]")
+                    total_duplicates += 1
+            commons_file.write(f"\nTotal duplicates found: {total_duplicates}\n")
+    finally:
+        index.close()
 
-    if len(unique_files) != total_files_reported:
-        print("Warning: There is a discrepancy between the retrieved files and the total reported by the API.")
-    else:
-        print("Success! The number of retrieved files matches the total reported by the API.")
+    print(f"Checked {total_files} files against {index_size} Commons hashes")
+    print(f"Total duplicates found: {total_duplicates}")
 
-    # Save the list of unique files to a file
-    with open(FILENAME, 'w', encoding='utf-8') as file:
-        for file_name in unique_files:
-            file.write(f"{file_name}\n")
+def main(*args):
+    # -index: build or refresh the Commons SHA-1 index (weekly) and exit
+    # -offline: check the files against that index instead of the API (daily)
+    # -incremental: check only files that may have changed since the last complete run
+    local_args = pywikibot.handle_args(args)
+    if '-index' in local_args:
+        count = sha1index.refresh(COMMONS_INDEX_FILE)
+        print(f"Commons SHA-1 index has {count} files")
+        return
 
-def main():
     site = pywikibot.Site(WIKI_LANGUAGE, WIKI_PROJECT)
 
-    # Clear the commons_duplicates.txt file at the beginning of the script
-    open(COMMONS_DUPLICATES_FILE, 'w').close()
+    # Fetch the file list and, unless the offline index is used, check each
+    # batch of files for Commons duplicates while the list is being read.
+    # An interrupted run continues from nowcommons_checkpoint.json.
+    offline = '-offline' in local_args
+    last_run = load_state().get('last_run') if '-incremental' in local_args else None
+    if '-incremental' in local_args and last_run is None:
+        print("No complete run yet, checking all files")
 
-    # Fetch file list and check for discrepancies
-    check_file_list(site)
+    def run():
+        if last_run is not None:
+            return run_incremental(site, last_run)
+        return run_pipeline(site, check_duplicates=not offline)
 
-    # After fetching the files, check each for a Commons link using the first script
+    completed = None  # start time of the run once it is complete
     try:
-        asyncio.run(process_file_list(FILENAME, BATCH_SIZE, site))
+        completed = asyncio.run(run())
     except RuntimeError as e:
         if "Event loop is closed" in str(e):
             # Handle the event loop closed error
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             try:
-                loop.run_until_complete(process_file_list(FILENAME, BATCH_SIZE, site))
+                completed = loop.run_until_complete(run())
             finally:
                 loop.close()
         else:
             # Log unexpected RuntimeErrors
-            print(f"RuntimeError in main(): {e}", file=sys.stderr)
+            print(f"RuntimeError in main(): {e}")
     except Exception as e:
         # Log unexpected exceptions
-        print(f"An unexpected error occurred in main(): {e}", file=sys.stderr)
+        print(f"An unexpected error occurred in main(): {e}")
+
+    if not completed:
+        return
+    if offline and last_run is None:
+        process_file_list_offline(FILENAME, COMMONS_INDEX_FILE)
+    record_reported(COMMONS_DUPLICATES_FILE)
+    save_state({'last_run': completed})
 
 if __name__ == "__main__":
     warnings.filterwarnings("ignore", category=RuntimeWarning)  # Ignore specific warnings
 
-    # Redirect stderr to suppress specific unwanted error messages
+    # Redirect stderr to suppress specific unwanted error messages; the
+    # script reports its own errors on stdout
     class StreamSuppressor:
         def write(self, _):
             pass
@@ -186,10 +586,10 @@ if __name__ == "__main__":
             pass
         else:
             # Log unexpected RuntimeErrors
-            print(f"RuntimeError in __main__: {e}", file=sys.stderr)
+            print(f"RuntimeError in __main__: {e}")
     except Exception as e:
         # Log all other unexpected exceptions
-        print(f"An unexpected error occurred in __main__: {e}", file=sys.stderr)
+        print(f"An unexpected error occurred in __main__: {e}")
     finally:
         try:
             # Ensure any lingering event loop is cleaned up
@@ -206,7 +606,7 @@ if __name__ == "__main__":
                 pass
             else:
                 # Log unexpected RuntimeErrors during final cleanup
-                print(f"RuntimeError during cleanup: {e}", file=sys.stderr)
+                print(f"RuntimeError during cleanup: {e}")
         except Exception as e:
             # Log all other unexpected exceptions during final cleanup
-            print(f"An unexpected error occurred during cleanup: {e}", file=sys.stderr)
+            print(f"An unexpected error occurred during cleanup: {e}")
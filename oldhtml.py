@@ -9,7 +9,10 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
 import wikitextparser as wtp
+from editbuffer import EditBuffer
 import re
 import difflib
 
@@ -19,6 +22,7 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -41,6 +45,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('<font', '<tt', '<strike')  # tags replaced by treat_page
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -70,11 +75,11 @@ class BasicBot(
         for template in parsed.templates:
             if template.name.strip().lower() == 'bots' or template.name.strip().lower() == 'nobots': return None # don't do anything if the page is exempt
         
+        edits = EditBuffer(text)
         tags = parsed.get_tags(name="font")
-        tags_dict = {}
         for tag in tags:
             if tag.contents == "":
-                text = text.replace(tag.string, "")
+                edits.remove_node(tag)
                 continue
             
             style = ""
@@ -121,11 +126,11 @@ class BasicBot(
                     case _:
                         style += f"font-size:{str(tag.get_attr("size")).strip()}"
             
+            # only the tags themselves are replaced, so nested font tags don't clash
             if style == "":
-                new_tag = tag.contents
+                edits.retag(tag, "", "")
             else:
-                new_tag = f'<span style="{style}">{tag.contents}</span>'
-            text = text.replace(tag.string, new_tag)
+                edits.retag(tag, f'<span style="{style}">', '</span>')
             
         ''' # теги center часто ставились криво, поки приховано щоб не наламати дров
         for tag in parsed.get_tags(name="center"):
@@ -140,10 +145,11 @@ class BasicBot(
                 '''
             
         for tag in parsed.get_tags(name="tt"):
-            text = text.replace(tag.string, f'<span style="font-family:monospace,monospace;">{tag.contents}</span>')
+            edits.retag(tag, '<span style="font-family:monospace,monospace;">', '</span>')
             
         for tag in parsed.get_tags(name="strike"):
-            text = text.replace(tag.string, f'<s>{tag.contents}</s>')
+            edits.retag(tag, '<s>', '</s>')
+        text = edits.apply()
          
         # if summary option is None, it takes the default i18n summary from
         # i18n subdirectory with summary_key as summary key.
@@ -169,6 +175,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -183,9 +191,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
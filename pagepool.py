@@ -0,0 +1,126 @@
+"""
+Worker-pool execution mode for bots with a pure text transform.
+
+pywikibot runs ``treat_page`` for one page at a time, so CPU-heavy
+conversions (tables.py, codexvar.py) use a single core. A bot that can
+express its change as a module-level function ``text -> new text`` sets it
+as ``transform`` and mixes in :class:`TransformPoolBot`. With ``-workers:N``
+pages taken from the generator are sent to N processes, which return
+(title, old revid, new text, summary); the main process still does every
+save and every prompt, in generator order, through the usual ``run()`` loop.
+
+Workers are forked from the main process and get the transform from there,
+so nothing but page texts has to be pickled. Where fork is not available
+the bot falls back to running the transform in the main process.
+"""
+from __future__ import annotations
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, NamedTuple
+
+import pywikibot
+
+_transform: Callable[[str], str] | None = None  # set before forking
+
+
+class PageResult(NamedTuple):
+
+    """What a worker sends back for one page."""
+
+    title: str
+    revid: int | None
+    new_text: str
+    summary: str | None  # None means the bot's default summary
+
+
+def _work(title: str, revid: int | None, text: str) -> PageResult:
+    return PageResult(title, revid, _transform(text), None)
+
+
+def _page_input(page) -> tuple[str, int | None, str] | None:
+    """Return what a worker needs from a preloaded page."""
+    try:
+        return page.title(), page.latest_revision_id, page.text
+    except pywikibot.exceptions.Error:
+        return None  # missing page, it is skipped by the bot anyway
+
+
+def pooled(generator, transform: Callable[[str], str], workers: int,
+           wanted: Callable[[str], bool] | None = None):
+    """Yield pages of *generator* with ``page.pool_result`` already set.
+
+    Pages come out in the same order as they went in; at most ``2 * workers``
+    pages are in flight at a time. If the transform failed for a page,
+    ``pool_result`` holds the exception. Pages whose text is not *wanted*
+    (see :class:`botbase.PrefilterBot`) are not sent to the workers.
+    """
+    global _transform
+    _transform = transform
+    context = multiprocessing.get_context('fork')
+    pending = deque()
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        for page in generator:
+            args = _page_input(page)
+            if args and wanted is not None and not wanted(args[2]):
+                args = None  # skipped by the bot, no need to transform it
+            future = executor.submit(_work, *args) if args else None
+            pending.append((page, future))
+            if len(pending) >= 2 * workers:
+                yield _finish(*pending.popleft())
+        while pending:
+            yield _finish(*pending.popleft())
+
+
+def _finish(page, future):
+    if future is not None:
+        try:
+            page.pool_result = future.result()
+        except Exception as e:
+            page.pool_result = e
+    return page
+
+
+class TransformPoolBot:
+
+    """Mixin running ``transform`` in a worker pool when -workers is given.
+
+    Put it first in the bases of a CurrentPageBot subclass and add
+    ``'workers': 0`` to its ``update_options``.
+    """
+
+    # staticmethod wrapping a module-level function: text -> new text
+    transform: Callable[[str], str] | None = None
+
+    def run(self) -> None:
+        workers = int(self.opt.workers or 0)
+        if workers > 1 and self.transform is not None:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                self.generator = pooled(self.generator, self.transform, workers,
+                                        getattr(self, 'wanted', None))
+            else:
+                pywikibot.warning('Worker processes need fork(); running '
+                                  'the transform in the main process.')
+        super().run()
+
+    def treat_page(self) -> None:
+        page = self.current_page
+        result = getattr(page, 'pool_result', None)
+        if result is None:
+            new_text, summary = self.transform(page.text), None
+        elif isinstance(result, Exception):
+            del page.pool_result
+            pywikibot.error(f'Transform failed for {page}: {result!r}')
+            return
+        else:
+            del page.pool_result
+            # The text was taken from this very revision and the save uses
+            # its timestamp as base, so edit conflicts are still detected
+            # by the wiki exactly as in a serial run.
+            if (result.title, result.revid) != (page.title(),
+                                                page.latest_revision_id):
+                raise RuntimeError(f'Worker result for {result.title} '
+                                   f'does not belong to {page}')
+            new_text, summary = result.new_text, result.summary
+        self.put_current(new_text, summary=summary or self.opt.summary)
@@ -0,0 +1,128 @@
+"""
+Persistent cache of named refs extracted from foreign wiki articles.
+
+transrefs.py and transrefs2.py look for definitions of empty refs in the
+sitelinked articles of other wikis. Downloading and scanning those articles
+again for every page (and every rerun) is the slow part, so the result of
+:func:`refindex.named_definitions` is stored on disk in SQLite, keyed by
+(site, title, revid). A cached article costs one light revision-id request
+and no text download or parse; a changed article gets a new revid and is
+read again.
+
+:func:`fetch_definitions` reads the sitelinked articles of one page from all
+wikis at once with a thread pool, so the wall time is that of the slowest
+wiki instead of the sum of all of them.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import queue
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pywikibot
+
+from refindex import named_definitions
+
+
+class ForeignRefCache:
+
+    """name -> full ref tag dictionaries of foreign pages, cached on disk.
+
+    :param filename: SQLite database, created if missing
+    """
+
+    def __init__(self, filename: str = 'foreign_refs.sqlite3') -> None:
+        # used from the fetch threads as well, every access takes the lock
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute('CREATE TABLE IF NOT EXISTS refs ('
+                        'site TEXT, title TEXT, revid INTEGER, refs TEXT, '
+                        'PRIMARY KEY (site, title, revid))')
+
+    def definitions(self, page) -> dict[str, str]:
+        """Return the named ref definitions of the current revision of *page*.
+
+        :raises pywikibot.exceptions.NoPageError: the page does not exist
+        """
+        key = (page.site.dbName(), page.title(), page.latest_revision_id)
+        with self.lock:
+            row = self.db.execute(
+                'SELECT refs FROM refs '
+                'WHERE site = ? AND title = ? AND revid = ?', key).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+
+        refs = named_definitions(page.text)
+        with self.lock, self.db:
+            # older revisions of the page are of no use any more
+            self.db.execute('DELETE FROM refs WHERE site = ? AND title = ?',
+                            key[:2])
+            self.db.execute('INSERT INTO refs VALUES (?, ?, ?, ?)',
+                            (*key, json.dumps(refs, ensure_ascii=False)))
+        pywikibot.debug(f'{page}: {len(refs)} named refs cached')
+        return refs
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+
+def fetch_definitions(pages, cache: ForeignRefCache, names, *,
+                      workers: int = 16, per_site: int = 2):
+    """Read named refs of *pages* concurrently and yield the useful ones.
+
+    Pages are fetched by *workers* threads, at most *per_site* at a time from
+    one wiki; the threads share pywikibot's HTTP session, so connections to
+    each host are kept alive and reused. Results come out as soon as they
+    are ready. When several are waiting (e.g. while the user answers a
+    prompt), the one that defines most of *names* comes first.
+
+    Close the generator to stop the search; pages not yet fetched are
+    cancelled.
+
+    :param names: ref names to look for
+    :return: generator of (page, {name: full ref tag}) with at least one name
+    """
+    names = set(names)
+    limits = defaultdict(lambda: threading.BoundedSemaphore(per_site))
+    results = queue.Queue()
+
+    def fetch(page):
+        try:
+            with limits[page.site.hostname()]:
+                refs = cache.definitions(page)
+        except Exception as e:  # the page must be reported in any case
+            pywikibot.warning(f'{page}: {e!r}')
+            refs = {}
+        results.put((page, {key: value for key, value in refs.items()
+                            if key in names}))
+
+    executor = ThreadPoolExecutor(workers)
+    try:
+        total = 0
+        for page in pages:
+            limits[page.site.hostname()]  # create the semaphore in this thread
+            executor.submit(fetch, page)
+            total += 1
+
+        ready = []  # heap of (-matches, arrival, page, refs)
+        arrived = 0
+        for _ in range(total):
+            block = not ready  # wait only if nothing is ready yet
+            while True:
+                try:
+                    page, refs = results.get(block=block)
+                except queue.Empty:
+                    break
+                heapq.heappush(ready, (-len(refs), arrived, page, refs))
+                arrived += 1
+                block = False
+            _, _, page, refs = heapq.heappop(ready)
+            if refs:
+                yield page, refs
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
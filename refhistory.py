@@ -0,0 +1,167 @@
+"""
+Older versions of a page, read for the definitions of named refs.
+
+``page.revisions(content=True)`` downloads the text of every revision before
+the first one is returned, and histrefs.py then indexed each of them. For an
+article with thousands of edits that is gigabytes of transfer.
+:class:`RefHistory` loads the history metadata once (ids, users, SHA-1) and
+then fetches texts newest first, :data:`BATCH_SIZE` revisions per request,
+only as far back as the caller keeps asking:
+
+* revisions with the same SHA-1 as one already read (reverts) are not
+  downloaded at all;
+* only the ref tags of a text are indexed, and only if their hash
+  differs from the one of the revision read before and one of the wanted
+  names occurs in them;
+* a definition that was already offered is not offered again;
+* the scan ends as soon as no wanted names are left.
+
+Usage::
+
+    for revision, found in RefHistory(page).scan(empty_tags):
+        ...  # found: name -> defining tag; del empty_tags[name] when taken
+
+:meth:`RefHistory.bisect` yields the same pairs, but finds the last
+definition of each name by bisection over the history.
+"""
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Collection, Iterator
+
+from refindex import RefEntry, RefIndex, named_definitions, ref_blocks
+
+BATCH_SIZE = 50  # revisions with content per API request
+
+
+class RefHistory:
+
+    """Revision history of *page*, without the current revision."""
+
+    def __init__(self, page, batch_size: int = BATCH_SIZE) -> None:
+        self.page = page
+        self.batch_size = batch_size
+        self._revisions = None
+
+    @property
+    def revisions(self) -> list:
+        """Metadata of the older revisions, newest first, without texts."""
+        if self._revisions is None:
+            latest = self.page.latest_revision_id
+            self._revisions = [revision for revision
+                               in self.page.revisions(content=False)
+                               if revision.revid != latest]
+        return self._revisions
+
+    def texts(self, revisions: list) -> Iterator[tuple[object, str]]:
+        """Yield (revision, text) for *revisions*, loading them in batches.
+
+        Texts are not kept by the page after they were yielded. The text
+        of a hidden revision is empty.
+        """
+        page = self.page
+        for start in range(0, len(revisions), self.batch_size):
+            batch = revisions[start:start + self.batch_size]
+            page.site.loadrevisions(page, content=True,
+                                    revids=[rev.revid for rev in batch])
+            for revision in batch:
+                loaded = page._revisions.pop(revision.revid, revision)
+                yield revision, loaded.text or ''
+
+    def _unique(self) -> list:
+        """Return revisions without the ones repeating an older text."""
+        seen_sha1 = set()
+        unique = []
+        for revision in self.revisions:
+            if revision.sha1 is not None:
+                if revision.sha1 in seen_sha1:
+                    continue
+                seen_sha1.add(revision.sha1)
+            unique.append(revision)
+        return unique
+
+    def scan(self, names: Collection[str]
+             ) -> Iterator[tuple[object, dict[str, str]]]:
+        """Yield older revisions that define any of *names*, newest first.
+
+        :param names: wanted ref names. It is checked again before every
+            revision, so the caller removes the names it has resolved and
+            the scan stops once the container is empty.
+        :return: (revision, name -> defining tag not offered before)
+        """
+        offered = set()
+        previous = None  # hash of the ref tags of the revision read before
+        texts = self.texts(self._unique())
+        try:
+            for revision, text in texts:
+                if not names:
+                    return
+                blocks = ref_blocks(text)
+                digest = hashlib.sha1(blocks.encode()).digest()
+                if digest == previous:
+                    continue  # same definitions, all offered already
+                previous = digest
+                if not any(name in blocks for name in names):
+                    continue
+                found = {}
+                for name, tag in named_definitions(blocks).items():
+                    if name in names and (name, tag) not in offered:
+                        offered.add((name, tag))
+                        found[name] = tag
+                if found:
+                    yield revision, found
+        finally:
+            texts.close()
+
+    def bisect(self, names: Collection[str]
+               ) -> Iterator[tuple[object, dict[str, str]]]:
+        """Yield the newest older revision that defines each of *names*.
+
+        Going back in time, a lost ref is first used without a definition,
+        then defined, and before it was added not used at all. The border
+        between the first two stretches is found by bisection, which
+        downloads O(log n) texts per name instead of reading the history
+        revision by revision. Probed texts are shared between names.
+        Revisions with a hidden text are left out.
+
+        Nothing is yielded for a name that was never defined in between,
+        e.g. because it was added to the page already broken; a linear
+        :meth:`scan` may still find it in a revision that broke the order.
+
+        :param names: wanted ref names, see :meth:`scan`
+        :return: (revision, {name: defining tag})
+        """
+        revisions = [revision for revision in self._unique()
+                     if revision.sha1 is not None]
+        probes: dict[int, RefIndex] = {}
+
+        def probe(i: int) -> RefEntry | None:
+            revision = revisions[i]
+            index = probes.get(revision.revid)
+            if index is None:
+                ((_, text),) = self.texts([revision])
+                index = probes[revision.revid] = RefIndex(text)
+            return index.names.get(name)
+
+        for name in list(names):
+            if not names:
+                return
+            if name not in names:
+                continue  # taken by the caller meanwhile
+            # revisions[:low] use the name without defining it
+            low, high = 0, len(revisions)
+            while low < high:
+                middle = (low + high) // 2
+                entry = probe(middle)
+                if entry is not None and not entry.definitions:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == len(revisions):
+                continue
+            entry = probe(low)
+            if entry is None or not entry.definitions:
+                continue
+            index = probes[revisions[low].revid]
+            yield revisions[low], {
+                name: index.string(entry.definitions[-1])}
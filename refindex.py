@@ -0,0 +1,197 @@
+"""
+Single-pass index of named references in wikitext.
+
+Scripts that work with named refs (fixrefs.py, transrefs.py, histrefs.py,
+dupcite.py, n2001.py) used to parse the whole page with wikitextparser,
+collect ``get_tags("ref")`` and then scan ``parsed.templates`` again for
+``{{R}}``. This module walks the raw text once with a single compiled
+regex and keeps only spans, so nothing but the needed substrings is ever
+copied.
+
+Usage::
+
+    index = RefIndex(text)
+    if index.exempt:
+        return None  # {{bots}} / {{nobots}} on the page
+    for name, span in index.missing().items():
+        print(name, index.string(span))
+"""
+from __future__ import annotations
+
+import re
+from typing import NamedTuple
+
+# Comments and nowiki blocks are matched first so that anything inside them
+# is consumed and never indexed.
+_TOKEN_RE = re.compile(r'''
+    <!--.*?(?:-->|\Z)
+  | <nowiki\s*>.*?(?:</nowiki\s*>|\Z)
+  | <ref(?=[\s/>])(?P<attrs>[^>]*?)
+        (?:/>|>(?P<body>.*?)</ref\s*>)
+  | \{\{\s*(?:
+        (?P<bots>(?:no)?bots)\s*[|}]
+      | r\s*\|(?P<rargs>[^{}]*)\}\}
+    )
+''', re.I | re.S | re.X)
+
+_NAME_RE = re.compile(
+    r'''\bname\s*=\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\s"'/>]+))''',
+    re.I,
+)
+
+
+class RefSpan(NamedTuple):
+
+    """Position of a ref tag or {{R}} template in the indexed text.
+
+    ``body_start``/``body_end`` delimit the contents between ``<ref ...>``
+    and ``</ref>``; they are equal for self-closing tags and templates.
+    """
+
+    start: int
+    end: int
+    body_start: int
+    body_end: int
+
+
+class RefEntry:
+
+    """All occurrences of one ref name, in document order."""
+
+    __slots__ = ('definitions', 'reuses', 'templates')
+
+    def __init__(self) -> None:
+        self.definitions: list[RefSpan] = []  # tags with contents
+        self.reuses: list[RefSpan] = []  # empty and self-closing tags
+        self.templates: list[RefSpan] = []  # {{R|name}}
+
+    @property
+    def definition(self) -> RefSpan | None:
+        """First tag that defines the ref, or None if it is never defined."""
+        return self.definitions[0] if self.definitions else None
+
+    @property
+    def has_tags(self) -> bool:
+        """Whether the name is used by at least one ``<ref>`` tag."""
+        return bool(self.definitions or self.reuses)
+
+    def __repr__(self) -> str:
+        return (f'RefEntry(definitions={self.definitions!r}, '
+                f'reuses={self.reuses!r}, templates={self.templates!r})')
+
+
+def _ref_name(attrs: str) -> str | None:
+    match = _NAME_RE.search(attrs)
+    if match is None:
+        return None
+    name = match.group('dq')
+    if name is None:
+        name = match.group('sq')
+    if name is None:
+        name = match.group('bare')
+    return name.strip() or None
+
+
+class RefIndex:
+
+    """Named refs of a page: name -> :class:`RefEntry`.
+
+    :param text: page wikitext
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.exempt = False
+        self.names: dict[str, RefEntry] = {}
+
+        for match in _TOKEN_RE.finditer(text):
+            if match.group('bots') is not None:
+                self.exempt = True
+            elif match.group('rargs') is not None:
+                name = match.group('rargs').split('|', 1)[0]
+                if '=' in name or not name.strip():
+                    continue
+                end = match.end()
+                self._entry(name.strip()).templates.append(
+                    RefSpan(match.start(), end, end, end))
+            elif match.group('attrs') is not None:
+                name = _ref_name(match.group('attrs'))
+                if name is None:
+                    continue
+                entry = self._entry(name)
+                if match.group('body'):
+                    entry.definitions.append(
+                        RefSpan(match.start(), match.end(),
+                                match.start('body'), match.end('body')))
+                else:
+                    end = match.end()
+                    entry.reuses.append(RefSpan(match.start(), end, end, end))
+
+    def _entry(self, name: str) -> RefEntry:
+        entry = self.names.get(name)
+        if entry is None:
+            entry = self.names[name] = RefEntry()
+        return entry
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __getitem__(self, name: str) -> RefEntry:
+        return self.names[name]
+
+    def string(self, span: RefSpan) -> str:
+        """Return the whole tag or template at *span*."""
+        return self.text[span.start:span.end]
+
+    def contents(self, span: RefSpan) -> str:
+        """Return the text between the opening and closing ref tags."""
+        return self.text[span.body_start:span.body_end]
+
+    def missing(self) -> dict[str, RefSpan]:
+        """Return names that are used but never defined.
+
+        Each name is mapped to its first use, an empty ref tag or an {{R}}
+        template, whichever comes first in the text.
+        """
+        result = {}
+        for name, entry in self.names.items():
+            if entry.definitions:
+                continue
+            uses = entry.reuses + entry.templates
+            result[name] = min(uses)
+        return result
+
+    def definitions(self) -> dict[str, str]:
+        """Return name -> full tag of the last defining ref for each name."""
+        return {name: self.string(entry.definitions[-1])
+                for name, entry in self.names.items() if entry.definitions}
+
+
+def named_definitions(text: str) -> dict[str, str]:
+    """Shortcut for ``RefIndex(text).definitions()``.
+
+    Used on foreign or historical page versions, where only the defining
+    tags are of interest.
+    """
+    return RefIndex(text).definitions()
+
+
+def ref_bodies(text: str):
+    """Yield the (start, end) spans of the contents of all ref tags.
+
+    Unlike :class:`RefIndex` this includes unnamed refs; refs inside
+    comments and nowiki are skipped as well.
+    """
+    for match in _TOKEN_RE.finditer(text):
+        if match.group('body'):
+            yield match.span('body')
+
+
+def ref_blocks(text: str) -> str:
+    """Return the ref tags with contents of *text*, one per line.
+
+    Named definitions of the result are those of *text*, so it can stand
+    in for the whole text when only the definitions are wanted.
+    """
+    return '\n'.join(match.group() for match in _TOKEN_RE.finditer(text)
+                     if match.group('body'))
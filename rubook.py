@@ -8,7 +8,10 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
 import wikitextparser as wtp
+from editbuffer import EditBuffer
 import re
 
 # This is required for the text that is shown when you run this script
@@ -17,6 +20,7 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -28,6 +32,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('заглавие',)  # parameter of the Russian {{книга}}
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -42,6 +47,7 @@ class BasicBot(
         parsed = wtp.parse(text)
         
         templates = parsed.templates
+        edits = EditBuffer(text)
         
         for template in templates:
             if template.name.lower().strip() == "книга":
@@ -50,13 +56,15 @@ class BasicBot(
                 for i in ["заглавие"]:
                     if i in argnames:
                         
-                        template_str = template.string
-                        template.name = "книга-ру"
+                        # only the name is replaced; the parsed tree is left untouched so that
+                        # spans of the following templates stay valid
+                        name_start = template.span[0] + 2 # after "{{"
+                        edits.replace(name_start, name_start + len(template.name), "книга-ру")
                         if "назва" in argnames: # хтось чомусь не до кінця перекладає шаблон
                             print("warning: назва in argnames")
                         
-                        text = text.replace(template_str, template.string)
                         break
+        text = edits.apply()
                         
         self.put_current(text, summary=self.opt.summary)
 
@@ -73,6 +81,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -87,9 +97,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
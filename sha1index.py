@@ -0,0 +1,230 @@
+"""
+On-disk index of the SHA-1 hashes of all Commons files.
+
+nowcommons.py needs to know only whether a local file has a copy on
+Commons, and the local ``allimages`` list already carries the SHA-1 of
+every file. With this index the whole list is checked without any request
+per file.
+
+The index file is the magic ``SHA1IDX1`` followed by sorted, unique 20 byte
+digests. It is memory-mapped and searched by bisection, so lookups need
+neither loading it nor much memory (about 2 GB for 100 million files).
+
+It is built by a crawl of Commons ``list=allimages`` with ``aiprop=sha1``
+(:func:`build`). The crawl saves its continuation in a state file and can
+be resumed. Later :func:`refresh` only reads files uploaded since the
+previous build, sorted by timestamp, and merges them in. Deleted Commons
+files stay in the index until the next full build.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import mmap
+import os
+import tempfile
+import time
+from itertools import groupby
+
+import pywikibot
+from pywikibot.data.api import Request
+
+MAGIC = b'SHA1IDX1'
+RECORD = 20  # bytes of a SHA-1 digest
+RUN_SIZE = 5_000_000  # digests sorted in memory at a time
+
+
+def digest(sha1: str) -> bytes:
+    """Return the 20 byte digest of a hex SHA-1 as given by the API."""
+    return bytes.fromhex(sha1)
+
+
+class Sha1Index:
+
+    """Read-only view of an index file.
+
+    :param filename: index file written by :func:`write_index`
+    """
+
+    def __init__(self, filename: str) -> None:
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC \
+                or (len(self._map) - len(MAGIC)) % RECORD:
+            self.close()
+            raise ValueError(f'{filename} is not a SHA-1 index')
+
+    def __len__(self) -> int:
+        return (len(self._map) - len(MAGIC)) // RECORD
+
+    def _record(self, i: int) -> bytes:
+        start = len(MAGIC) + i * RECORD
+        return self._map[start:start + RECORD]
+
+    def __contains__(self, sha1: str | bytes) -> bool:
+        key = digest(sha1) if isinstance(sha1, str) else sha1
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low < len(self) and self._record(low) == key
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._record(i)
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+
+def _sorted_runs(digests, directory: str):
+    """Sort *digests* in runs of :data:`RUN_SIZE`, spilling runs to disk."""
+    runs = []
+    batch = []
+    for item in digests:
+        batch.append(item)
+        if len(batch) == RUN_SIZE:
+            runs.append(_spill(sorted(batch), directory))
+            batch = []
+    batch.sort()
+    if not runs:
+        return [batch]
+    runs.append(_spill(batch, directory))
+    return [_read_run(run) for run in runs]
+
+
+def _spill(batch: list[bytes], directory: str) -> str:
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False,
+                                     suffix='.run') as f:
+        f.write(b''.join(batch))
+    return f.name
+
+
+def _read_run(filename: str):
+    try:
+        with open(filename, 'rb') as f:
+            while record := f.read(RECORD):
+                yield record
+    finally:
+        os.remove(filename)
+
+
+def write_index(filename: str, digests, presorted: bool = False) -> int:
+    """Write an index file of *digests* (20 byte values, in any order).
+
+    The file is replaced only after it was written completely.
+
+    :param presorted: digests are already sorted, skip sorting them
+    :return: number of unique digests written
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    count = 0
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False,
+                                     suffix='.tmp') as f:
+        try:
+            f.write(MAGIC)
+            merged = (digests if presorted
+                      else heapq.merge(*_sorted_runs(digests, directory)))
+            for key, _ in groupby(merged):
+                f.write(key)
+                count += 1
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, filename)
+    return count
+
+
+def _collect(filename: str, params: dict) -> tuple[str, float]:
+    """Crawl Commons allimages, appending the digests to ``filename.part``.
+
+    The continuation is saved in ``filename.state`` after every request,
+    so an interrupted crawl with the same parameters is resumed.
+
+    :return: part file name and the time the crawl was started
+    """
+    state_file = filename + '.state'
+    part = filename + '.part'
+    try:
+        with open(state_file, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if state.get('params') != params:
+        state = {'params': params, 'continue': {}, 'started': time.time()}
+        if os.path.exists(part):
+            os.remove(part)  # left from another crawl
+
+    site = pywikibot.Site('commons', 'commons')
+    query = dict(params, action='query', list='allimages', aiprop='sha1',
+                 ailimit='max')
+    with open(part, 'ab') as f:
+        while True:
+            request = Request(site, parameters=dict(query, **state['continue']))
+            result = request.submit()
+            files = result['query']['allimages']
+            f.write(b''.join(digest(file_info['sha1']) for file_info in files))
+            f.flush()
+            if 'continue' not in result:
+                break
+            state['continue'] = result['continue']
+            with open(state_file, 'w', encoding='utf-8') as state_f:
+                json.dump(state, state_f)
+            if files:
+                pywikibot.info(f"Commons files read up to {files[-1]['name']}")
+    return part, state['started']
+
+
+def _read_part(part: str):
+    with open(part, 'rb') as f:
+        while record := f.read(RECORD):
+            yield record
+
+
+def _finish(filename: str, part: str, started: float, digests,
+            presorted: bool = False) -> int:
+    count = write_index(filename, digests, presorted)
+    with open(filename + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'built': started}, f)
+    os.remove(part)
+    if os.path.exists(filename + '.state'):
+        os.remove(filename + '.state')
+    return count
+
+
+def build(filename: str) -> int:
+    """Build the index of all Commons files, resuming a previous crawl.
+
+    :return: number of digests in the index
+    """
+    part, started = _collect(filename, {'aisort': 'name'})
+    return _finish(filename, part, started, _read_part(part))
+
+
+def refresh(filename: str) -> int:
+    """Add Commons files uploaded since the index was built.
+
+    Falls back to :func:`build` if there is no index yet.
+
+    :return: number of digests in the index
+    """
+    try:
+        with open(filename + '.json', encoding='utf-8') as f:
+            built = json.load(f)['built']
+    except (OSError, ValueError, KeyError):
+        return build(filename)
+    since = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                          time.gmtime(built - 3600))  # some overlap
+    part, started = _collect(filename, {'aisort': 'timestamp',
+                                        'aistart': since})
+    index = Sha1Index(filename)
+    try:
+        digests = heapq.merge(iter(index), sorted(_read_part(part)))
+        return _finish(filename, part, started, digests, presorted=True)
+    finally:
+        index.close()
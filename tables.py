@@ -9,101 +9,162 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
+from pagepool import TransformPoolBot
 import re
-from bs4 import BeautifulSoup
-import mwparserfromhell as mwparser
+from lxml import etree
+import wikitextparser as wtp
+from editbuffer import EditBuffer
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
-def format_attrs(element):
-    attributes = ""
-    for attr in element.attrs:
-        if attr == 'class':
-            # Join class names with spaces
-            attributes += f' {attr}="{" ".join(element.attrs[attr])}"'
-        else:
-            attributes += f' {attr}="{str(element.attrs[attr])}"'
-    return attributes
-
+TABLE_PATTERN = re.compile(r'(<table.*?>.*?</table>)', re.DOTALL | re.IGNORECASE)
+WHITESPACE = re.compile(r'[ \t\n\r\f]+')  # HTML whitespace, not &nbsp;
+# characters of cell text that would turn into markup or vanish when saved
+TEXT_ESCAPES = re.compile(r'&(?=#?\w+;)|<(?=[a-zA-Z/!])|\xa0')
+ESCAPED = {'&': '&amp;', '<': '&lt;', '\xa0': '&nbsp;'}
+QUOTE = '"'
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+             'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+# table markup, plain and safe inside template parameters
+MARKUP = {
+    False: {'start': '{|', 'end': '|}', 'row': '|-', 'caption': '|+',
+            'td': '|', 'th': '!', 'sep': '|'},
+    True: {'start': '{{(!}}', 'end': '{{!)}}', 'row': '{{!-}}', 'caption': '{{!}}+',
+           'td': '{{!}}', 'th': '!', 'sep': '{{!}}'},
+}
+
+
+def format_attrs(element) -> str:
+    attributes = []
+    for name, value in element.attrib.items():
+        attributes.append(f' {name}="{WHITESPACE.sub(" ", value).strip()}"')
+    return ''.join(attributes)
+
+
+def escape_text(text: str) -> str:
+    """Collapse whitespace and escape the text of an element for wikitext."""
+    return TEXT_ESCAPES.sub(lambda match: ESCAPED[match[0]], WHITESPACE.sub(' ', text))
+
+
+def _serialize(element, out: list) -> None:
+    """Append the HTML of *element* without its tail to *out*."""
+    if element.tag is etree.Comment:
+        out.append(f'<!--{element.text or ""}-->')
+        return
+    if not isinstance(element.tag, str):
+        return  # processing instruction
+    attributes = ''.join(
+        f' {name}="{escape_text(value).replace(QUOTE, "&quot;")}"'
+        for name, value in element.attrib.items())
+    if element.tag in VOID_TAGS and not len(element) and not element.text:
+        out.append(f'<{element.tag}{attributes}/>')
+        return
+    out.append(f'<{element.tag}{attributes}>')
+    _serialize_contents(element, out)
+    out.append(f'</{element.tag}>')
+
+
+def _serialize_contents(element, out: list) -> None:
+    if element.text:
+        out.append(escape_text(element.text))
+    for child in element:
+        _serialize(child, out)
+        if child.tail:
+            out.append(escape_text(child.tail))
+
+
+def inner_html(element) -> str:
+    """Return the contents of *element* as HTML with collapsed whitespace."""
+    out = []
+    _serialize_contents(element, out)
+    return ''.join(out).strip()
+
+
+def table_rows(table):
+    """Yield the rows of *table*, also those in thead, tbody and tfoot."""
+    for child in table:
+        if child.tag == 'tr':
+            yield child
+        elif child.tag in ('thead', 'tbody', 'tfoot'):
+            for row in child:
+                if row.tag == 'tr':
+                    yield row
 
-def fix_html_table(html_table: str) -> str:
-    """
-    Attempt to auto-fix malformed HTML tables using BeautifulSoup (lxml parser).
-    Returns a cleaned, valid HTML <table> string.
-    """
-    # Parse with a forgiving parser that auto-closes tags
-    soup = BeautifulSoup(html_table, 'lxml')
 
-    table = soup.find('table')
-    if not table:
-        return html_table  # No valid table found, return original
-
-    # Normalize formatting (strip extra whitespace)
-    fixed_html = str(table)
-    fixed_html = re.sub(r'\s+', ' ', fixed_html)
-    fixed_html = fixed_html.replace("> <", "><").strip()
-
-    return fixed_html
-    
 def html_to_wikitext_table(html_table: str, inside_template: bool = False) -> str:
     """
     Convert an HTML table to MediaWiki table syntax, preserving attributes.
+    Malformed HTML is fixed by the lxml parser, which auto-closes tags.
     If inside_template=True, use template-safe syntax ({{!}}, {{!-}}, etc.).
     """
-    soup = BeautifulSoup(html_table, 'lxml')
-    table = soup.find('table')
-    if not table:
+    document = etree.HTML(html_table)
+    table = document.find('.//table') if document is not None else None
+    if table is None:
         return ""
 
-    attributes = format_attrs(table)
-    wikitext_table = f"\n{{|{attributes}"
+    markup = MARKUP[inside_template]
+    out = ['\n', markup['start'], format_attrs(table)]
 
     # Caption
     caption = table.find('caption')
-    if caption:
+    if caption is not None:
         caption_attrs = format_attrs(caption)
-        caption_content = ''.join(str(i) for i in caption.contents).strip()
+        caption_content = inner_html(caption)
         if caption_attrs:
-            wikitext_table += f"\n|+ {caption_attrs} | {caption_content}"
+            out.append(f"\n{markup['caption']} {caption_attrs} {markup['sep']} {caption_content}")
         else:
-            wikitext_table += f"\n|+ {caption_content}"
+            out.append(f"\n{markup['caption']} {caption_content}")
 
     # Rows
-    for row in table.find_all('tr'):
-        row_attrs = format_attrs(row)
-        wikitext_table += f"\n|- {row_attrs}"
+    for row in table_rows(table):
+        out.append(f"\n{markup['row']} {format_attrs(row)}")
 
-        for cell in row.find_all(['td', 'th']):
+        for cell in row:
+            if cell.tag not in ('td', 'th'):
+                continue
             cell_attrs = format_attrs(cell)
-            marker = "!" if cell.name == 'th' else "|"
-            cell_content = ''.join(str(i) for i in cell.contents).strip()
+            marker = markup[cell.tag]
+            cell_content = inner_html(cell)
 
             if cell_attrs:
-                wikitext_table += f"\n{marker}{cell_attrs} | {cell_content}"
+                out.append(f"\n{marker}{cell_attrs} {markup['sep']} {cell_content}")
             else:
-                wikitext_table += f"\n{marker} {cell_content}"
-
-    wikitext_table += "\n|}"
-
-    if inside_template:
-        # Escape wiki table syntax for use inside templates
-        replacements = {
-            "{|": "{{(!}}",
-            "|}": "{{!)}}",
-            "|-": "{{!-}}",
-        }
-        for k, v in replacements.items():
-            wikitext_table = wikitext_table.replace(k, v)
-        # Replace line-leading ! and | (only where they indicate cell markers)
-        wikitext_table = re.sub(r'(?m)^\!', '{{!!}}', wikitext_table)
-        wikitext_table = re.sub(r'(?m)^\|', '{{!}}', wikitext_table)
-        wikitext_table = re.sub(r' \| ', ' {{!}} ', wikitext_table)
-
-    return wikitext_table
-    
+                out.append(f"\n{marker} {cell_content}")
+
+    out.append('\n')
+    out.append(markup['end'])
+    return ''.join(out)
+
+
+def convert_tables(text: str) -> str:
+    """Fix and convert HTML tables in page text to MediaWiki syntax."""
+    if '<table' not in text.lower():
+        return text
+    matches = list(TABLE_PATTERN.finditer(text))
+    if not matches:
+        return text
+
+    # tables in template (and parser function) parameters need escaped markup
+    parsed = wtp.parse(text)
+    template_spans = [node.span for node in parsed.templates + parsed.parser_functions]
+
+    edits = EditBuffer(text)
+    for match in matches:
+        start, end = match.span()
+        inside_template = any(span_start < start and end < span_end
+                              for span_start, span_end in template_spans)
+        edits.replace(start, end, html_to_wikitext_table(match[0], inside_template))
+    return edits.apply()
+
+
 class TableConverterBot(
+    TransformPoolBot,  # -workers:N converts pages in N processes
+    PrefilterBot,  # skips pages without any of the prefilter strings
     SingleSiteBot,
     ConfigParserBot,
     ExistingPageBot,
@@ -112,38 +173,15 @@ class TableConverterBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'table-conversion'
+    prefilter = ('<table',)
 
     update_options = {
         'summary': 'Заміна HTML-таблиць на MediaWiki-таблиці',  # your own bot summary
+        'workers': 0,  # number of worker processes for the conversion
     }
 
-    def treat_page(self) -> None:
-        """Load the given page, fix and convert HTML tables to MediaWiki syntax."""
-        text = self.current_page.text
-        summary = self.opt.summary
-        wikicode = mwparser.parse(text)
-
-        table_pattern = re.compile(r'(<table.*?>.*?</table>)', re.DOTALL | re.IGNORECASE)
-
-        for template in wikicode.filter_templates(recursive=True):
-            for param in template.params:
-                param_text = str(param.value)
-                html_tables = table_pattern.findall(param_text)
-                for html_table in html_tables:
-                    fixed = fix_html_table(html_table)
-                    wikitext_table = html_to_wikitext_table(fixed, inside_template=True)
-                    param_text = param_text.replace(html_table, wikitext_table)
-                param.value = mwparser.wikicode.Wikicode(param_text)
-
-        plain_text = str(wikicode)
-        html_tables = table_pattern.findall(plain_text)
-        for html_table in html_tables:
-            fixed = fix_html_table(html_table)
-            wikitext_table = html_to_wikitext_table(fixed, inside_template=False)
-            plain_text = plain_text.replace(html_table, wikitext_table)
-
-        self.put_current(plain_text, summary=summary)
-    
+    transform = staticmethod(convert_tables)
+
 def main(*args: str) -> None:
     """
     Process command line arguments and invoke bot.
@@ -156,18 +194,22 @@ def main(*args: str) -> None:
     local_args = pywikibot.handle_args(args)
     gen_factory = pagegenerators.GeneratorFactory()
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary',):
+        if option in ('summary', 'workers'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
         else:
             options[option] = True
 
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
         bot = TableConverterBot(generator=gen, **options)
@@ -0,0 +1,88 @@
+import io
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import tweetedat
+
+
+'''
+A fake Twitter with a tweet every 7 ids and one timestamp step per id. Some
+ids in the range are missing, as deleted tweets are
+'''
+
+
+def fake_tweets(start_tweet_id, end_tweet_id):
+    tweets = {tweet_id: 1000 + tweet_id for tweet_id in range(start_tweet_id, end_tweet_id + 1, 7)}
+    tweets[end_tweet_id] = 1000 + end_tweet_id
+    return tweets
+
+
+class BuildTweetTimelineTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint_path = os.path.join(directory.name, "TimelineCheckpoint.json")
+
+    def test_build(self):
+        tweets = fake_tweets(0, 1000)
+        api = tweetedat.FakeTweetApi(tweets, tweetedat.TokenBucket(10000, capacity=4))
+        points = tweetedat.build_tweet_timeline(api, 0, 1000, 50, self.checkpoint_path, workers=4)
+        pairs = sorted((point["TweetId"], point["Timestamp"]) for point in points)
+        self.assertEqual(pairs[0], (0, 1000))
+        self.assertEqual(pairs[-1], (1000, 2000))
+        for tweet_id, timestamp in pairs:
+            self.assertEqual(tweets[tweet_id], timestamp)
+        gaps = [next_timestamp - timestamp for (_, timestamp), (_, next_timestamp) in zip(pairs, pairs[1:])]
+        self.assertLessEqual(max(gaps), 50)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_finer_tolerance_ignores_checkpoint(self):
+        tweets = fake_tweets(0, 1000)
+        with open(self.checkpoint_path, "w") as file_checkpoint:
+            json.dump({"tolerance": 2000, "start_tweet_id": 0, "end_tweet_id": 1000,
+                       "points": [[0, 1000], [1000, 2000]], "pending": [[0, 1000, 1000, 2000]]}, file_checkpoint)
+        coarse = tweetedat.build_tweet_timeline(tweetedat.FakeTweetApi(tweets), 0, 1000, 2000, self.checkpoint_path)
+        fine = tweetedat.build_tweet_timeline(tweetedat.FakeTweetApi(tweets), 0, 1000, 20, self.checkpoint_path)
+        self.assertEqual(len(coarse), 2)
+        self.assertGreater(len(fine), 50)
+
+    def test_resume(self):
+        tweets = fake_tweets(0, 1000)
+        with open(self.checkpoint_path, "w") as file_checkpoint:
+            json.dump({"tolerance": 50, "start_tweet_id": 0, "end_tweet_id": 1000,
+                       "points": [[0, 1000], [504, 1504], [1000, 2000]],
+                       "pending": [[504, 1504, 1000, 2000]]}, file_checkpoint)
+        api = tweetedat.FakeTweetApi(tweets)
+        points = tweetedat.build_tweet_timeline(api, 0, 1000, 50, self.checkpoint_path)
+        # only the pending second half is refined
+        self.assertTrue(all(point["TweetId"] >= 504 for point in points[3:]))
+        self.assertEqual(api.requests, 2 * (len(points) - 3))
+
+    def test_missing_end_tweet(self):
+        api = tweetedat.FakeTweetApi(fake_tweets(0, 1000))
+        with self.assertRaises(ValueError):
+            tweetedat.build_tweet_timeline(api, 0, 1001, 50, self.checkpoint_path)
+
+
+class FindTweetIdsTest(unittest.TestCase):
+    def test_find(self):
+        random.seed(1)
+        tweets = fake_tweets(0, 1000)
+        api = tweetedat.FakeTweetApi(tweets, tweetedat.TokenBucket(10000, capacity=4))
+        found = []
+        file_test_set = io.StringIO()
+        tweetedat.find_tweet_ids(api, 0, 1000, 5, found, file_test_set, workers=4)
+        lines = file_test_set.getvalue().splitlines()
+        self.assertEqual(len(lines), len(found))
+        self.assertLessEqual(len(found), 5)
+        self.assertEqual(len(set(found)), len(found))
+        for line in lines:
+            tweet_id, timestamp = map(int, line.split(","))
+            self.assertEqual(tweets[tweet_id], timestamp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,7 +9,12 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
+import xmldump
+from botbase import PrefilterBot
+from editbuffer import EditBuffer
+from refindex import RefIndex
+from refcache import ForeignRefCache
+from wikidata import EntityBatcher
 import re
 import difflib
 
@@ -19,6 +24,7 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -30,6 +36,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('<ref', '{{r')  # named refs, also {{r}}
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -39,56 +46,33 @@ class BasicBot(
         'tlang': 'en',
     }
 
+    def __init__(self, generator, **kwargs) -> None:
+        # sitelinks are requested from Wikidata for a whole batch of pages at once
+        self.sitelinks = EntityBatcher(generator, 'sitelinks')
+        # named refs of foreign articles, kept between pages and runs
+        self.ref_cache = ForeignRefCache()
+        super().__init__(generator=self.sitelinks.pages(), **kwargs)
+
+    def teardown(self) -> None:
+        self.ref_cache.close()
+        super().teardown()
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
         text = self.current_page.text
         summary = self.opt.summary
 
-        parsed = wtp.parse(text)
-        tags = parsed.get_tags(name="ref")
-        tags_dict = {} # only ref tags
-        empty_tags = {} # all tags; name (str): stringified tag/template (str)
-
-        # Handle <ref> tags
-        for tag in tags:
-            if "name" in tag.attrs:
-                #print("Tag: " + tag.string)
-                name = tag.attrs["name"].replace("/", "")
-                
-                # Only update tags_dict if the tag's contents are not empty or not already in tags_dict
-                if name not in tags_dict or len(tags_dict[name].contents) == 0:
-                    if len(tag.contents) == 0:
-                        empty_tags[name] = str(tag)
-                        #print("added to empty")
-                    tags_dict[name] = tag
-                    #print("added to tags_dict")
-                
-                # Remove from empty_tags if we now have a tag with contents
-                if name in empty_tags and len(tag.contents) != 0:
-                    empty_tags.pop(name)
-                    #print("removed from empty")
-
-        # Handle {{R}} templates
-        r_templates = parsed.templates
-        empty_rs = {}
-        for template in r_templates:
-            if template.name.strip().lower() == 'bots' or template.name.strip().lower() == 'nobots': return None # don't do anything if the page is exempt
-            if template.name.strip().lower() == 'r' and template.arguments:
-                #print("R: " + template.string)
-                name = template.arguments[0].value
-                #print(name)
-                empty_rs[name] = template
-                if name not in tags_dict:
-                    empty_tags[name] = str(template)
-                    #print("added to empty")
+        index = RefIndex(text)
+        if index.exempt: return None # don't do anything if the page is exempt
+        # name (str): first tag/template that uses the name (RefSpan)
+        empty_tags = index.missing()
+        edits = EditBuffer(text)
 
         if len(empty_tags):
-            print(empty_tags)
-            tags_replaced = 0
+            print(list(empty_tags))
             stop_search = False
             try:
-                item = pywikibot.ItemPage.fromPage(self.current_page)
-                for iterlink in item.iterlinks():
+                for iterlink in self.sitelinks.iterlinks(self.current_page):
                     if stop_search:
                         break
                     if iterlink.site.family.name != "wikipedia":
@@ -96,16 +80,7 @@ class BasicBot(
                     if iterlink.site.lang in ["en", "ru"]:
                         print(f'Looking through {iterlink.site.lang}')
                         iterlink_page = pywikibot.Page(iterlink)
-                        iterlink_text = iterlink_page.text
-                        iterlink_parsed = wtp.parse(iterlink_text)
-                        iterlink_tags = iterlink_parsed.get_tags(name="ref")
-
-                        iterlink_dict = {}
-                        for tag in iterlink_tags:
-                            if "name" in tag.attrs:
-                                if len(tag.contents) == 0:
-                                    continue
-                                iterlink_dict[tag.attrs["name"]] = tag
+                        iterlink_dict = self.ref_cache.definitions(iterlink_page)
                         
                         for key, value in iterlink_dict.items():
                             
@@ -116,9 +91,10 @@ class BasicBot(
                                 while True:
                                     press_y = input().lower()
                                     if press_y == "y":
-                                        tags_replaced += 1
-                                        new_ref = value.string
-                                        text = text.replace(empty_tags[key], new_ref, 1)
+                                        new_ref = value
+                                        span = empty_tags[key]
+                                        edits.replace(span.start, span.end, new_ref)
+                                        del empty_tags[key]
                                         break
                                     if press_y == "n":
                                         break
@@ -126,11 +102,12 @@ class BasicBot(
                                         stop_search = True
                                         break
                                         
-                            if tags_replaced == len(empty_tags): stop_search = True
+                            if len(empty_tags) == 0: stop_search = True
 
             except pywikibot.exceptions.NoPageError:
                 print("No page found; Likely no interwiki pages are linked.")
 
+        text = edits.apply()
         self.put_current(text, summary=summary)
 
 
@@ -153,6 +130,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -167,9 +146,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
@@ -8,11 +8,16 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
 import wikitextparser as wtp
-from urllib.parse import urlparse
+from editbuffer import EditBuffer
 import tweetedat  # Import the tweetedat module
+from collections import OrderedDict
 from datetime import datetime, timezone
+import json
 import logging
+import re
 import warnings
 
 # Suppress specific deprecation warnings
@@ -29,7 +34,89 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 websites = {}
 
+# https://twitter.com/<user>/status/<id>, also x.com, mobile.twitter.com etc.
+TWEET_URL = re.compile(
+    r'(?:https?:)?//(?:[\w-]+\.)*(?:twitter|x)\.com(?::\d+)?'
+    r'/(?P<user>\w+)/status(?:es)?/(?P<id>\d+)(?:[/?#]|$)', re.IGNORECASE)
+CACHE_SIZE = 100_000  # tweets kept in memory
+
+
+def match_tweet_url(url):
+    """Return (user, tweet id) of a tweet URL, or None for other URLs."""
+    match = TWEET_URL.match(url)
+    if match is None:
+        return None
+    return match['user'], match['id']
+
+
+class TweetCache:
+
+    """Process-wide LRU cache: tweet id -> (user, date).
+
+    The date is computed from the id by tweetedat, so an entry never goes
+    stale and the cache can be kept on disk between runs with -cache:file.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.filename = None
+        self.changed = False
+        self._entries = OrderedDict()
+
+    def load(self, filename):
+        self.filename = filename
+        try:
+            with open(filename, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for tweet_id, (user, date) in entries.items():
+            self._entries[tweet_id] = (user, date)
+        self._trim()
+
+    def save(self):
+        if self.filename is None or not self.changed:
+            return
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f)
+        self.changed = False
+
+    def _trim(self):
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def lookup(self, tweets):
+        """Return tweet id -> (user, date) for the tweets that have a date.
+
+        :param tweets: tweet id -> user from the URL. Ids missing from the
+            cache are dated in one tweetedat batch.
+        """
+        found = {}
+        missing = []
+        for tweet_id, user in tweets.items():
+            entry = self._entries.get(tweet_id)
+            if entry is None:
+                missing.append(tweet_id)
+            else:
+                self._entries.move_to_end(tweet_id)
+                found[tweet_id] = entry
+        if missing:
+            timestamps = tweetedat.find_tweet_timestamps([int(tweet_id) for tweet_id in missing])
+            for tweet_id, timestamp in zip(missing, timestamps):
+                logging.debug(f"Timestamp for tweet ID {tweet_id}: {timestamp}")
+                if timestamp == -1:
+                    continue
+                date = datetime.fromtimestamp(timestamp / 1000, timezone.utc).strftime('%Y-%m-%d')
+                found[tweet_id] = self._entries[tweet_id] = (tweets[tweet_id], date)
+                self.changed = True
+            self._trim()
+        return found
+
+
+tweet_cache = TweetCache()
+
 class BasicBot(
+    PrefilterBot,
     SingleSiteBot,
     ConfigParserBot,
     ExistingPageBot,
@@ -38,14 +125,20 @@ class BasicBot(
 
     use_redirects = False
     summary_key = 'basic-changing'
+    prefilter = ('twitter.com', 'x.com')  # tweet URLs
 
     update_options = {
         'replace': False,
         'summary': "Заміна Cite web, що цитує Твітер, на Cite tweet",
         'text': 'Test',
         'top': False,
+        'cache': '',  # file keeping the tweet dates between runs
     }
 
+    def teardown(self) -> None:
+        tweet_cache.save()
+        super().teardown()
+
     def treat_page(self) -> None:
         text = self.current_page.text
         parsed = wtp.parse(text)
@@ -55,65 +148,39 @@ class BasicBot(
             logging.warning("No templates found in the page.")
             return
 
+        # cite web templates citing a tweet: (template, user, tweet id)
+        citations = []
         for template in templates:
-            template_str = template.string
             try:
                 if "cite web" in template.name.lower():
                     for argument in template.arguments:
                         if "url" in argument.name.strip().lower():
-                            url = argument.value.strip()
-                            if self.is_tweet_url(url):
-                                tweet_info = self.extract_tweet_info(url)
-                                if tweet_info:
-                                    cite_tweet_template = self.create_cite_tweet_template(tweet_info, template)
-                                    text = text.replace(template_str, cite_tweet_template)
+                            tweet = match_tweet_url(argument.value.strip())
+                            if tweet:
+                                citations.append((template, *tweet))
+                                break
             except Exception as e:
                 logging.error(f"Error processing template: {e}")
-                logging.error(f"Problematic template: {template_str}")
+                logging.error(f"Problematic template: {template.string}")
+
+        tweets = tweet_cache.lookup({tweet_id: user for _, user, tweet_id in citations})
+        edits = EditBuffer(text)
+        for template, user, tweet_id in citations:
+            if tweet_id not in tweets:
+                logging.warning(f"Failed to extract tweet info from URL of tweet {tweet_id}")
                 continue
+            user, date = tweets[tweet_id]
+            logging.info(f"Extracted tweet info - User: {user}, Tweet ID: {tweet_id}, Date: {date}")
+            tweet_info = {'id': tweet_id, 'user': user, 'date': date}
+            try:
+                cite_tweet_template = self.create_cite_tweet_template(tweet_info, template)
+                edits.replace_node(template, cite_tweet_template)
+            except Exception as e:
+                logging.error(f"Error processing template: {e}")
+                logging.error(f"Problematic template: {template.string}")
+        text = edits.apply()
         self.put_current(text, summary=self.opt.summary)
 
-    def is_tweet_url(self, url):
-        # Check if the URL is a tweet URL
-        parsed_url = urlparse(url)
-        path_parts = parsed_url.path.split('/')
-
-        if "twitter.com" in parsed_url.hostname or "x.com" in parsed_url.hostname:
-            if len(path_parts) >= 4 and path_parts[2] == 'status':
-                return True
-            if len(path_parts) >= 5 and path_parts[1] == 'i' and path_parts[2] == 'web' and path_parts[3] == 'status':
-                return True
-        return False
-
-    def extract_tweet_info(self, url):
-        # Extract tweet ID and user from the URL
-        parsed_url = urlparse(url)
-        path_parts = parsed_url.path.split('/')
-
-        logging.debug(f"Parsed URL: {parsed_url}")
-        logging.debug(f"Path parts: {path_parts}")
-
-        tweet_id = None
-        user = None
-
-        if len(path_parts) >= 4 and path_parts[2] == 'status':
-            user = path_parts[1]
-            tweet_id = path_parts[3]
-        elif len(path_parts) >= 5 and path_parts[1] == 'i' and path_parts[2] == 'web' and path_parts[3] == 'status':
-            user = path_parts[4]
-            tweet_id = path_parts[5]
-
-        if tweet_id and tweet_id.isdigit():
-            # Extract date using tweetedat
-            timestamp = tweetedat.find_tweet_timestamp(int(tweet_id))
-            logging.debug(f"Timestamp for tweet ID {tweet_id}: {timestamp}")
-            if timestamp != -1:
-                date = datetime.utcfromtimestamp(timestamp / 1000).strftime('%Y-%m-%d')
-                logging.info(f"Extracted tweet info - User: {user}, Tweet ID: {tweet_id}, Date: {date}")
-                return {'id': tweet_id, 'user': user, 'date': date}
-        logging.warning(f"Failed to extract tweet info from URL: {url}")
-        return None
-
     def create_cite_tweet_template(self, tweet_info, old_template):
         # Create a cite tweet template string
         tweet_id = tweet_info['id']
@@ -148,19 +215,25 @@ def main(*args: str) -> None:
     local_args = pywikibot.handle_args(args)
     gen_factory = pagegenerators.GeneratorFactory()
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary', 'text'):
+        if option in ('summary', 'text', 'cache'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
         else:
             options[option] = True
 
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
+        if options.get('cache'):
+            tweet_cache.load(options['cache'])
         bot = BasicBot(generator=gen, **options)
         bot.run()
 
@@ -8,6 +8,28 @@ import csv
 import argparse
 import os
 import time
+import ast
+import mmap
+import struct
+import sys
+import zlib
+import json
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+PRE_SNOWFLAKE_LAST_TWEET_ID = 29700859247
+MISSING_TWEET_CODES = {34, 63, 144, 179}  # no such tweet or user, suspended, protected
+_timeline = None  # (tweet ids, timestamps) of the timeline, loaded on first use
+
+# TweetTimeline.bin: header, then the tweet ids and the timestamps as two packed
+# little-endian int64 columns of the same length, sorted by tweet id.
+# The checksum is the CRC-32 of both columns.
+TIMELINE_MAGIC = b'TWTLINE\0'
+TIMELINE_VERSION = 1
+TIMELINE_HEADER = struct.Struct('<8sIIQI4x')  # magic, version, header size, count, checksum
 
 
 '''
@@ -15,7 +37,7 @@ Generate data points for estimation of Tweet Id sand their timestamps before Sno
 '''
 
 
-def break_tweet_timeline(tolerance):
+def break_tweet_timeline(tolerance, workers=8, rate=1.0):
     '''
     Last timestamp found from Memento Link:
     https://web.archive.org/web/20190618182911/https://twitter.com/nytimes/status/29548970348
@@ -23,13 +45,12 @@ def break_tweet_timeline(tolerance):
     '''
     end_tweet_id = 29700859247
     start_tweet_id = 20
-    list_tweets = []
-    twitter_object = create_twitter_instance()
-    tweet_timestamp = get_tweet_timestamp(start_tweet_id, twitter_object)
-    list_tweets.append({"TweetId": start_tweet_id, "Timestamp": tweet_timestamp})
-    tweet_timestamp = get_tweet_timestamp(end_tweet_id, twitter_object)
-    list_tweets.append({"TweetId": end_tweet_id, "Timestamp": tweet_timestamp})
-    list_tweet_ids = generate_tweet_timestamp_id(list_tweets[0], list_tweets[1], twitter_object, list_tweets, tolerance)
+    data_directory = os.path.join(os.path.dirname( __file__ ), '..', "data")
+    if not os.path.exists(data_directory):
+        os.mkdir(data_directory)
+    api = TwitterApi(TokenBucket(rate, capacity=max(1, workers)))
+    list_tweets = build_tweet_timeline(api, start_tweet_id, end_tweet_id, tolerance,
+                                       os.path.join(data_directory, "TimelineCheckpoint.json"), workers)
     write_data_points(list_tweets)
 
 
@@ -56,60 +77,369 @@ def write_data_points(list_tweets):
     with open(os.path.join(data_directory, "TweetTimeline.txt"), "w") as file_tweet_timeline:
         for i in range(0, len(list_tweet_ids)):
             file_tweet_timeline.write(str(list_tweet_ids[i]) + "," + str(list_tweet_timestamps[i]) + "," +  str(datetime.utcfromtimestamp(list_tweet_timestamps[i]))+ "\n")
+    write_timeline_binary(os.path.join(data_directory, "TweetTimeline.bin"), zip(list_tweet_ids, list_tweet_timestamps))
+
+
+'''
+Read a text timeline, either TweetTimeline.txt (id,timestamp,date lines) or
+TweetTimelineList.txt (a list of [id, timestamp]), as pairs sorted by tweet id
+'''
+
+
+def read_timeline_text(path):
+    with open(path, "r") as file_tweet_timeline:
+        content = file_tweet_timeline.read()
+    if content.lstrip().startswith("["):
+        pairs = [(int(tweet_id), int(timestamp)) for tweet_id, timestamp in ast.literal_eval(content)]
+    else:
+        pairs = []
+        for line in content.splitlines():
+            if line.strip():
+                line_parts = line.split(",", 2)
+                pairs.append((int(line_parts[0]), int(line_parts[1])))
+    pairs.sort()
+    return pairs
+
+
+'''
+Write the binary timeline from (tweet id, timestamp) pairs
+'''
+
+
+def write_timeline_binary(path, pairs):
+    pairs = sorted(pairs)
+    tweet_ids = array('q', [pair[0] for pair in pairs])
+    timestamps = array('q', [pair[1] for pair in pairs])
+    if sys.byteorder == 'big':
+        tweet_ids.byteswap()
+        timestamps.byteswap()
+    data = tweet_ids.tobytes() + timestamps.tobytes()
+    header = TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, TIMELINE_HEADER.size, len(pairs), zlib.crc32(data))
+    with open(path + ".tmp", "wb") as file_timeline:
+        file_timeline.write(header)
+        file_timeline.write(data)
+    os.replace(path + ".tmp", path)
 
 
 '''
-Use divide and conquer technique to find the data points between start and end tweet ids
+Memory-map the binary timeline and return its two columns. Nothing is copied,
+several processes share the same pages. The checksum is only compared with
+verify=True, as that reads the whole file
 '''
 
 
-def generate_tweet_timestamp_id(start, end, twitter_object, list_tweets, tolerance):
-    if abs(end["Timestamp"] - start["Timestamp"]) <= tolerance or end["Timestamp"] < start["Timestamp"]:
-        return list_tweets
-    mid = int((start["TweetId"] + end["TweetId"]) / 2)
-    tweet_id = get_current_tweet_id(mid, int(start["TweetId"]), int(end["TweetId"]))
-    if tweet_id > 0:
-        tweet_timestamp  = get_tweet_timestamp(tweet_id, twitter_object)
-        mid = {"TweetId": tweet_id, "Timestamp": tweet_timestamp}
-        list_tweets.append(mid)
-        generate_tweet_timestamp_id(start, mid, twitter_object, list_tweets, tolerance)
-        generate_tweet_timestamp_id(mid, end, twitter_object, list_tweets, tolerance)
-    return list_tweets
+def open_timeline_binary(path, verify=False):
+    with open(path, "rb") as file_timeline:
+        mapped = mmap.mmap(file_timeline.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < TIMELINE_HEADER.size:
+        raise ValueError(path + " is not a tweet timeline")
+    magic, version, header_size, count, checksum = TIMELINE_HEADER.unpack_from(mapped)
+    if magic != TIMELINE_MAGIC:
+        raise ValueError(path + " is not a tweet timeline")
+    if version != TIMELINE_VERSION:
+        raise ValueError(path + " has unsupported version " + str(version))
+    if len(mapped) != header_size + 16 * count:
+        raise ValueError(path + " is truncated")
+    data = memoryview(mapped)[header_size:]
+    if verify and zlib.crc32(data) != checksum:
+        raise ValueError(path + " is corrupted, checksum mismatch")
+    if sys.byteorder == 'little':
+        return data[:8 * count].cast('q'), data[8 * count:].cast('q')
+    tweet_ids, timestamps = array('q'), array('q')
+    tweet_ids.frombytes(data[:8 * count])
+    timestamps.frombytes(data[8 * count:])
+    tweet_ids.byteswap()
+    timestamps.byteswap()
+    return tweet_ids, timestamps
 
 
 '''
-Get timestamp of any Tweet in millisconds using Twitter API
+Convert a text timeline to the binary one and check the result
 '''
 
 
-def get_tweet_timestamp(tweet_id, twitter_object):
+def convert_timeline(text_path, binary_path):
+    pairs = read_timeline_text(text_path)
+    write_timeline_binary(binary_path, pairs)
+    tweet_ids, timestamps = open_timeline_binary(binary_path, verify=True)
+    if list(zip(tweet_ids, timestamps)) != pairs:
+        raise ValueError(binary_path + " does not match " + text_path)
+    print("Wrote " + str(len(pairs)) + " data points to " + binary_path)
+
+
+'''
+Token bucket shared by all builder threads: at most rate requests per second
+on average, with bursts of up to capacity requests
+'''
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+'''
+Source of tweet data for the dataset and test set builders. TwitterApi asks
+Twitter, FakeTweetApi answers from memory
+'''
+
+
+class TweetApi(ABC):
+    # Timestamp of an existing tweet in seconds, None if it cannot be found
+    @abstractmethod
+    def timestamp(self, tweet_id):
+        ...
+
+    # An existing tweet id near tweet_id strictly between the limits, or -1
+    @abstractmethod
+    def existing_tweet_id(self, tweet_id, left_limit_tweet_id, right_limit_tweet_id):
+        ...
+
+    # Whether tweet_id is an existing tweet
+    @abstractmethod
+    def exists(self, tweet_id):
+        ...
+
+
+class TwitterApi(TweetApi):
+    def __init__(self, limiter, sample_twitter_url="https://twitter.com/jack/status/"):
+        self.limiter = limiter
+        self.sample_twitter_url = sample_twitter_url
+        self.twitter_object = create_twitter_instance()
+
+    def head(self, url, **kwargs):
+        self.limiter.acquire()
+        return requests.head(url, **kwargs)
+
+    def timestamp(self, tweet_id):
+        return get_tweet_timestamp(tweet_id, self.twitter_object, acquire=self.limiter.acquire)
+
+    def existing_tweet_id(self, tweet_id, left_limit_tweet_id, right_limit_tweet_id):
+        return get_current_tweet_id(tweet_id, left_limit_tweet_id, right_limit_tweet_id,
+                                    self.sample_twitter_url, self.head)
+
+    def exists(self, tweet_id):
+        return tweet_exists(tweet_id, self.sample_twitter_url, self.head)
+
+
+'''
+In-memory stand-in for Twitter: tweets maps the existing tweet ids to their
+timestamps. Requests go through the limiter if one is given and are counted
+'''
+
+
+class FakeTweetApi(TweetApi):
+    def __init__(self, tweets, limiter=None):
+        self.tweets = dict(tweets)
+        self.tweet_ids = sorted(self.tweets)
+        self.limiter = limiter
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def request(self):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        with self.lock:
+            self.requests += 1
+
+    def timestamp(self, tweet_id):
+        self.request()
+        return self.tweets.get(tweet_id)
+
+    def existing_tweet_id(self, tweet_id, left_limit_tweet_id, right_limit_tweet_id):
+        self.request()
+        # the first existing tweet at or after tweet_id, else the last before it
+        index = bisect_left(self.tweet_ids, tweet_id)
+        for candidate in self.tweet_ids[index:index + 1] + self.tweet_ids[max(0, index - 1):index]:
+            if left_limit_tweet_id < candidate < right_limit_tweet_id:
+                return candidate
+        return -1
+
+    def exists(self, tweet_id):
+        self.request()
+        return tweet_id in self.tweets
+
+
+'''
+One divide and conquer step for the interval between two data points: returns
+the data point found near the middle (or None) and the intervals still to be
+refined
+'''
+
+
+def refine_interval(api, interval, tolerance):
+    start_id, start_timestamp, end_id, end_timestamp = interval
+    if abs(end_timestamp - start_timestamp) <= tolerance or end_timestamp < start_timestamp:
+        return None, []
+    tweet_id = api.existing_tweet_id((start_id + end_id) // 2, start_id, end_id)
+    if tweet_id <= 0:
+        return None, []
+    tweet_timestamp = api.timestamp(tweet_id)
+    if tweet_timestamp is None:
+        return None, []
+    return ([tweet_id, tweet_timestamp],
+            [[start_id, start_timestamp, tweet_id, tweet_timestamp],
+             [tweet_id, tweet_timestamp, end_id, end_timestamp]])
+
+
+'''
+Build the timeline between two tweet ids by divide and conquer, refining
+independent intervals in parallel threads. All requests go through the
+api, which shares one rate limit. The data points found so far and the
+intervals still pending are saved to checkpoint_path, and a build started
+again with the same file, ids and tolerance continues from there; a checkpoint
+of other ids or another tolerance is ignored. Intervals that failed stay
+pending for the next run, and the checkpoint is deleted once none is left
+'''
+
+
+def build_tweet_timeline(api, start_tweet_id, end_tweet_id, tolerance, checkpoint_path, workers=8,
+                         checkpoint_interval=30):
+    build = {"tolerance": tolerance, "start_tweet_id": start_tweet_id, "end_tweet_id": end_tweet_id}
     try:
-        twitter_response = twitter_object.GetStatus(tweet_id)
-        tweet_date_time = datetime.strptime(twitter_response.created_at, "%a %b %d %H:%M:%S %z %Y")
-        return int(tweet_date_time.timestamp())
-    except Exception as e:
-        print(e)
-        time.sleep(300)
-        get_tweet_timestamp(tweet_id, twitter_object)
+        with open(checkpoint_path, "r") as file_checkpoint:
+            state = json.load(file_checkpoint)
+    except (OSError, ValueError):
+        state = None
+    if state is not None and any(state.get(key) != value for key, value in build.items()):
+        print("Ignoring " + checkpoint_path + ", it belongs to another build")
+        state = None
+    if state is not None:
+        print("Resuming with " + str(len(state["points"])) + " data points and " + str(len(state["pending"])) + " intervals")
+    else:
+        start_timestamp = api.timestamp(start_tweet_id)
+        end_timestamp = api.timestamp(end_tweet_id)
+        for tweet_id, timestamp in ((start_tweet_id, start_timestamp), (end_tweet_id, end_timestamp)):
+            if timestamp is None:
+                raise ValueError("No timestamp for tweet " + str(tweet_id) + ", choose another start or end tweet")
+        state = dict(build, points=[[start_tweet_id, start_timestamp], [end_tweet_id, end_timestamp]],
+                     pending=[[start_tweet_id, start_timestamp, end_tweet_id, end_timestamp]])
+
+    def save_checkpoint():
+        with open(checkpoint_path + ".tmp", "w") as file_checkpoint:
+            json.dump(state, file_checkpoint)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    failed = []
+    saved = time.monotonic()
+    with ThreadPoolExecutor(workers) as executor:
+        running = {executor.submit(refine_interval, api, interval, tolerance): interval
+                   for interval in state["pending"]}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                interval = running.pop(future)
+                try:
+                    point, intervals = future.result()
+                except Exception as e:
+                    print("Interval " + str(interval[0]) + "-" + str(interval[2]) + " failed: " + repr(e))
+                    failed.append(interval)
+                    continue
+                state["pending"].remove(interval)
+                if point is not None:
+                    state["points"].append(point)
+                for new_interval in intervals:
+                    state["pending"].append(new_interval)
+                    running[executor.submit(refine_interval, api, new_interval, tolerance)] = new_interval
+            if time.monotonic() - saved >= checkpoint_interval:
+                save_checkpoint()
+                saved = time.monotonic()
+                print(str(len(state["points"])) + " data points, " + str(len(running)) + " intervals in progress")
+    if state["pending"]:
+        save_checkpoint()
+    elif os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if failed:
+        print(str(len(failed)) + " intervals failed, run the build again to retry them")
+    return [{"TweetId": tweet_id, "Timestamp": timestamp} for tweet_id, timestamp in state["points"]]
+
+
+'''
+Get timestamp of any Tweet in seconds using Twitter API. Failed requests are
+retried after retry_delay seconds; None is returned once the retries are used
+up or if the tweet does not exist or cannot be seen. acquire is called before
+every request, e.g. to wait for a rate limiter
+'''
+
+
+def get_tweet_timestamp(tweet_id, twitter_object, retries=3, retry_delay=300, acquire=None):
+    for attempt in range(retries + 1):
+        if acquire is not None:
+            acquire()
+        try:
+            twitter_response = twitter_object.GetStatus(tweet_id)
+            tweet_date_time = datetime.strptime(twitter_response.created_at, "%a %b %d %H:%M:%S %z %Y")
+            return int(tweet_date_time.timestamp())
+        except Exception as e:
+            print(e)
+            if twitter_error_codes(e) & MISSING_TWEET_CODES:
+                return None
+            if attempt < retries:
+                time.sleep(retry_delay)
+    return None
+
+
+'''
+Error codes of a python-twitter TwitterError, whose message is a list of
+{'code': ..., 'message': ...} dicts
+'''
+
+
+def twitter_error_codes(error):
+    message = error.args[0] if error.args else None
+    if not isinstance(message, list):
+        return set()
+    return {item.get('code') for item in message if isinstance(item, dict)}
+
+
+'''
+Whether a tweet exists: its URL answers 200 or redirects to a status that does
+'''
+
+
+def tweet_exists(tweet_id, sample_twitter_url="https://twitter.com/jack/status/", head=requests.head):
+    response = head(sample_twitter_url + str(tweet_id))
+    if response.status_code == 200:
+        return True
+    if response.status_code == 301 or response.status_code == 302:
+        if "status/" in response.headers['location']:
+            return head(response.headers['location']).status_code == 200
+    return False
 
 '''
 Get the current valid tweet id around the specified tweet id
 '''
 
 
-def get_current_tweet_id(tweet_id, left_limit_tweet_id, right_limit_tweet_id):
-    sample_twitter_url = "https://twitter.com/jack/status/"
+def get_current_tweet_id(tweet_id, left_limit_tweet_id, right_limit_tweet_id,
+                         sample_twitter_url="https://twitter.com/jack/status/", head=requests.head):
     step_size = 0
     data_directory = os.path.join(os.path.dirname( __file__ ), '..', "data")
     current_tweet_id = tweet_id
     counter = 0
     while current_tweet_id and left_limit_tweet_id < current_tweet_id < right_limit_tweet_id:
-        response = requests.head(sample_twitter_url + str(current_tweet_id))
+        response = head(sample_twitter_url + str(current_tweet_id))
         if response.status_code == 200:
             return current_tweet_id
         elif response.status_code == 301 or response.status_code == 302:
             if "status/" in response.headers['location']:
-                redirect_response = requests.head(response.headers['location'])
+                redirect_response = head(response.headers['location'])
                 if redirect_response.status_code == 200:
                     return int (str(response.headers['location']).split("/")[-1])
                 else:
@@ -128,12 +458,12 @@ def get_current_tweet_id(tweet_id, left_limit_tweet_id, right_limit_tweet_id):
     step_size = 0
     counter= 0
     while tweet_id and left_limit_tweet_id < tweet_id < right_limit_tweet_id:
-        response = requests.head(sample_twitter_url + str(tweet_id))
+        response = head(sample_twitter_url + str(tweet_id))
         if response.status_code == 200:
             return tweet_id
         elif response.status_code == 301 or response.status_code == 302:
             if "status/" in response.headers['location']:
-                redirect_response = requests.head(response.headers['location'])
+                redirect_response = head(response.headers['location'])
                 if redirect_response.status_code == 200:
                     return int (str(response.headers['location']).split("/")[-1])
                 else:
@@ -178,6 +508,47 @@ def find_tweet_timestamp_post_snowflake(tid):
     return tstamp
 
 
+'''
+Load the timeline once as two parallel sequences sorted by tweet id:
+memory-mapped from TweetTimeline.bin, or parsed from TweetTimeline.txt
+if there is no binary file or the text file is newer
+'''
+
+
+def load_timeline():
+    global _timeline
+    if _timeline is None:
+        data_directory = os.path.join(os.path.dirname( __file__ ), '..', "data")
+        text_path = os.path.join(data_directory, "TweetTimeline.txt")
+        binary_path = os.path.join(data_directory, "TweetTimeline.bin")
+        if os.path.exists(binary_path) and (not os.path.exists(text_path)
+                                            or os.path.getmtime(binary_path) >= os.path.getmtime(text_path)):
+            _timeline = open_timeline_binary(binary_path)
+        else:
+            pairs = read_timeline_text(text_path)
+            _timeline = (array('q', [pair[0] for pair in pairs]), array('q', [pair[1] for pair in pairs]))
+    return _timeline
+
+
+'''
+Estimated timestamp in milliseconds of tid, which lies between the timeline points
+at index - 1 and index, or -1 if it is outside the timeline
+'''
+
+
+def estimate_timestamp(tweet_ids, timestamps, index, tid):
+    if index == len(tweet_ids):
+        return -1
+    if tweet_ids[index] == tid:
+        return timestamps[index] * 1000
+    if index == 0:
+        return -1
+    prev_id, next_id = tweet_ids[index - 1], tweet_ids[index]
+    prev_timestamp, next_timestamp = timestamps[index - 1], timestamps[index]
+    estimated_timestamp = round(prev_timestamp + (((tid - prev_id) / (next_id - prev_id)) * (next_timestamp - prev_timestamp)))
+    return estimated_timestamp * 1000
+
+
 '''
 Returns Tweet Timestamp for pre-Snowflake Tweets
 Success: Returns the estimated timestamp of the tweet
@@ -186,24 +557,8 @@ Failure: Returns -1
 
 
 def find_tweet_timestamp_pre_snowflake(tid):
-    data_directory = os.path.join(os.path.dirname( __file__ ), '..', "data")
-    with open(os.path.join(data_directory, "TweetTimeline.txt"), "r") as file_tweet_timeline:
-        prev_line_parts = file_tweet_timeline.readline().rstrip().split(",")
-        if tid < int(prev_line_parts[0]):
-            return -1
-        elif tid == int(prev_line_parts[0]):
-            return int(prev_line_parts[1]) * 1000
-        else:
-            for line in file_tweet_timeline:
-                line_parts = line.rstrip().split(",")
-                if tid == int(line_parts[0]):
-                    return int(prev_line_parts[1]) * 1000
-                if int(prev_line_parts[0]) < tid < int(line_parts[0]):
-                    estimated_timestamp = round(int(prev_line_parts[1]) + (((tid - int(prev_line_parts[0])) / (int(line_parts[0]) - int(prev_line_parts[0]))) * (int(line_parts[1]) - int(prev_line_parts[1]))))
-                    return estimated_timestamp * 1000
-                else:
-                    prev_line_parts = line_parts
-    return -1
+    tweet_ids, timestamps = load_timeline()
+    return estimate_timestamp(tweet_ids, timestamps, bisect_left(tweet_ids, tid), tid)
 
 '''
 Find timestamp of a tweet
@@ -211,21 +566,46 @@ Find timestamp of a tweet
 
 
 def find_tweet_timestamp(tid):
-    pre_snowflake_last_tweet_id = 29700859247
-    if tid < pre_snowflake_last_tweet_id:
+    if tid < PRE_SNOWFLAKE_LAST_TWEET_ID:
         tweet_timestamp = find_tweet_timestamp_pre_snowflake(tid)
     else:
         tweet_timestamp = find_tweet_timestamp_post_snowflake(tid)
     return tweet_timestamp
 
 
+'''
+Find timestamps of many tweets at once, returned in the order of tids.
+The pre-Snowflake ids are sorted and located in the timeline in one pass,
+each search starting where the previous one ended. timeline is a pair
+(tweet ids, timestamps) to use instead of the default one
+'''
+
+
+def find_tweet_timestamps(tids, timeline=None):
+    tweet_timestamps = [-1] * len(tids)
+    pre_snowflake = []
+    for position, tid in enumerate(tids):
+        if tid < PRE_SNOWFLAKE_LAST_TWEET_ID:
+            pre_snowflake.append((tid, position))
+        else:
+            tweet_timestamps[position] = find_tweet_timestamp_post_snowflake(tid)
+    if pre_snowflake:
+        tweet_ids, timestamps = timeline or load_timeline()
+        index = 0
+        for tid, position in sorted(pre_snowflake):
+            index = bisect_left(tweet_ids, tid, index)
+            tweet_timestamps[position] = estimate_timestamp(tweet_ids, timestamps, index, tid)
+    return tweet_timestamps
+
+
 '''
 Generate test points of Tweet Ids
 '''
 
 
-def create_test_set(start_tweet_id, end_tweet_id, data_points=0, data_interval=0):
+def create_test_set(start_tweet_id, end_tweet_id, data_points=0, data_interval=0, workers=8, rate=1.0):
     list_current_test_id = []
+    api = TwitterApi(TokenBucket(rate, capacity=max(1, workers)))
     data_directory = os.path.join(os.path.dirname( __file__ ), '..', "data")
     with open(os.path.join(data_directory, "testset.txt"), "w") as file_test_set:
         if data_interval > 0:
@@ -243,71 +623,130 @@ def create_test_set(start_tweet_id, end_tweet_id, data_points=0, data_interval=0
                         list_interval_tweet_ids.append(temp_tweet_id)
                         week_timestamp += (data_interval * 24 * 60 * 60)
             for i in range(1, len(list_interval_tweet_ids)):
-                find_tweet_ids(list_interval_tweet_ids[i - 1], list_interval_tweet_ids[i], data_points, list_current_test_id, file_test_set)
+                find_tweet_ids(api, list_interval_tweet_ids[i - 1], list_interval_tweet_ids[i], data_points, list_current_test_id, file_test_set, workers)
         else:
-            find_tweet_ids(start_tweet_id, end_tweet_id, data_points, list_current_test_id, file_test_set)
+            find_tweet_ids(api, start_tweet_id, end_tweet_id, data_points, list_current_test_id, file_test_set, workers)
 
 
 '''
-Find tweet id status
+Find random existing tweet ids between the limits and write them with their
+timestamps to the test set. The probes run in parallel threads, a batch of
+workers ids at a time, and all requests go through the api and its rate limit
 '''
 
 
-def find_tweet_ids(start_tweet_id, end_tweet_id, data_points, list_current_test_id, file_test_set):
-    sample_twitter_url = "https://twitter.com/jack/status/"
+def probe_tweet(api, tweet_id):
+    if not api.exists(tweet_id):
+        return None
+    return api.timestamp(tweet_id)
+
+
+def find_tweet_ids(api, start_tweet_id, end_tweet_id, data_points, list_current_test_id, file_test_set, workers=8):
     points = 0
-    twitter_object = create_twitter_instance()
     count = 0
-    while points < data_points and count < (data_points * 5):
-        tweet_status = False
-        current_tweet_id = random.randint(start_tweet_id, end_tweet_id)
-        response = requests.head(sample_twitter_url + str(current_tweet_id))
-        if response.status_code == 200:
-            tweet_status = True
-        elif response.status_code == 301 or response.status_code == 302:
-            if "status/" in response.headers['location']:
-                redirect_response = requests.head(response.headers['location'])
-                if redirect_response.status_code == 200:
-                    tweet_status = True
-        if tweet_status and current_tweet_id not in list_current_test_id:
-            list_current_test_id.append(current_tweet_id)
-            random_tweet_timestamp = get_tweet_timestamp(current_tweet_id, twitter_object)
-            file_test_set.write(str(current_tweet_id) + "," + str(random_tweet_timestamp) + "\n")
-            points += 1
-        count += 1
+    with ThreadPoolExecutor(workers) as executor:
+        while points < data_points and count < (data_points * 5):
+            batch = [random.randint(start_tweet_id, end_tweet_id)
+                     for _ in range(min(workers, data_points - points, data_points * 5 - count))]
+            count += len(batch)
+            batch = [tweet_id for tweet_id in dict.fromkeys(batch) if tweet_id not in list_current_test_id]
+            for current_tweet_id, random_tweet_timestamp in zip(batch, executor.map(lambda tweet_id: probe_tweet(api, tweet_id), batch)):
+                if random_tweet_timestamp is None or points == data_points:
+                    continue
+                list_current_test_id.append(current_tweet_id)
+                file_test_set.write(str(current_tweet_id) + "," + str(random_tweet_timestamp) + "\n")
+                points += 1
     return
 
 
 '''
-Find average error on test points
+Read the test set as two parallel arrays: tweet ids and their real timestamps
 '''
 
 
-def find_estimate_error():
+def read_test_set(path):
+    tweet_ids = array('q')
+    timestamps = array('q')
+    with open(path, "r") as file_test_set:
+        for line in file_test_set:
+            line_parts = line.rstrip().split(",")
+            if len(line_parts) == 2:
+                tweet_ids.append(int(line_parts[0]))
+                timestamps.append(int(line_parts[1]))
+    return tweet_ids, timestamps
+
+
+'''
+Nearest-rank percentile of an already sorted list
+'''
+
+
+def percentile(sorted_values, percent):
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[rank - 1]
+
+
+def format_error(seconds):
+    return str(seconds // (60*60)) + ":" + str(seconds % (60*60) // 60) + ":" + str(seconds % 60)
+
+
+'''
+Find the error of the estimates on the test points. All test ids are looked up
+in one batch; the lookup is repeated rounds times to measure its throughput.
+With compare the per-id lookup is timed as well. timeline_path evaluates another
+timeline file (.txt or .bin), e.g. one built with a different threshold
+'''
+
+
+def find_estimate_error(rounds=1, compare=False, timeline_path=None):
     data_directory = os.path.join(os.path.dirname( __file__ ), '..', "data")
     if not os.path.exists(data_directory):
         os.mkdir(data_directory)
-    cumulative_error = 0
-    data_points = 0
-    file_test_error = open(os.path.join( data_directory, "testerror.csv"), "w")
-    fieldnames = ["TweetId", "TweetTimestamp", "EstimatedTimestamp", "Error"]
-    writer = csv.DictWriter(file_test_error, fieldnames=fieldnames)
-    writer.writeheader()
-    with open(os.path.join(data_directory, "testset.txt"), "r") as file_test_test:
-        for line in file_test_test:
-            data_points += 1
-            line_parts = line.rstrip().split(",")
-            estimated_timestamp = find_tweet_timestamp(int(line_parts[0]))
-            error = abs(int(estimated_timestamp / 1000) - int(line_parts[1]))
-            cumulative_error += error
-            writer.writerow({"TweetId": line_parts[0], "TweetTimestamp": line_parts[1], "EstimatedTimestamp": int(estimated_timestamp / 1000), "Error": error})
-    file_test_error.close()
-    error_rate = int(cumulative_error / data_points)
-    hour_error = int(error_rate / (60*60))
-    error_rate = error_rate % (60*60)
-    minute_error = int(error_rate / 60)
-    error_rate = error_rate % 60
-    print("Error rate: " + str(hour_error) + ":" + str(minute_error) + ":" + str(error_rate))
+    test_ids, test_timestamps = read_test_set(os.path.join(data_directory, "testset.txt"))
+    if not test_ids:
+        print("The test set is empty")
+        return
+    if timeline_path is None:
+        timeline = load_timeline()
+    elif timeline_path.endswith(".bin"):
+        timeline = open_timeline_binary(timeline_path)
+    else:
+        pairs = read_timeline_text(timeline_path)
+        timeline = (array('q', [pair[0] for pair in pairs]), array('q', [pair[1] for pair in pairs]))
+    print("Timeline: " + str(len(timeline[0])) + " data points, test set: " + str(len(test_ids)) + " tweet ids")
+
+    rounds = max(1, rounds)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        estimated_timestamps = find_tweet_timestamps(test_ids, timeline)
+    elapsed = time.perf_counter() - start
+    print("Batch lookup: " + str(int(len(test_ids) * rounds / elapsed)) + " ids/sec")
+    if compare:
+        tweet_ids, timestamps = timeline
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for tid in test_ids:
+                estimate_timestamp(tweet_ids, timestamps, bisect_left(tweet_ids, tid), tid)
+        elapsed = time.perf_counter() - start
+        print("Single lookup: " + str(int(len(test_ids) * rounds / elapsed)) + " ids/sec")
+
+    estimated_seconds = [int(estimated_timestamp / 1000) for estimated_timestamp in estimated_timestamps]
+    errors = [abs(estimated - real) for estimated, real in zip(estimated_seconds, test_timestamps)]
+    with open(os.path.join(data_directory, "testerror.csv"), "w", newline="") as file_test_error:
+        writer = csv.writer(file_test_error)
+        writer.writerow(["TweetId", "TweetTimestamp", "EstimatedTimestamp", "Error"])
+        writer.writerows(zip(test_ids, test_timestamps, estimated_seconds, errors))
+
+    # ids outside the timeline have no estimate and are left out of the statistics
+    found_errors = sorted(error for error, estimated in zip(errors, estimated_timestamps) if estimated != -1)
+    if len(found_errors) < len(errors):
+        print(str(len(errors) - len(found_errors)) + " tweet ids are outside the timeline")
+    if not found_errors:
+        return
+    print("Error rate: " + format_error(sum(found_errors) // len(found_errors)))
+    for percent in (50, 90, 99):
+        print("p" + str(percent) + ": " + format_error(percentile(found_errors, percent)))
+    print("max: " + format_error(found_errors[-1]))
 
 def fix_test_set_arguments(argument):
     start_tweet_id = argument[0]
@@ -331,14 +770,23 @@ if __name__== "__main__":
     group.add_argument('-d', dest='dataset', nargs='?', const="7*24*60*60", type=threshold_value, help="Create a dataset with argument of theshold value in seconds")
     group.add_argument('-e', dest='errortest', action='store_true', help="Check error on pre-Snowflake ids")
     group.add_argument('-t', dest='timestamp', type=int, help="Find timestamp of any tweet id")
+    group.add_argument('-c', dest='convert', action='store_true', help="Convert data/TweetTimeline.txt to the binary data/TweetTimeline.bin")
+    parser.add_argument('-b', dest='rounds', type=int, default=1, help="Repeat the lookups of -e this many times to measure their speed")
+    parser.add_argument('--compare', action='store_true', help="With -e, also time the lookup of one id at a time")
+    parser.add_argument('--timeline', default=None, help="With -e, evaluate this timeline file instead of data/TweetTimeline")
+    parser.add_argument('-w', dest='workers', type=int, default=8, help="Parallel requests while creating a dataset or test set")
+    parser.add_argument('-r', dest='rate', type=float, default=1.0, help="Requests per second while creating a dataset or test set")
     args = parser.parse_args()
     if args.testset:
         start_tweet_id, end_tweet_id, data_points, data_interval = fix_test_set_arguments(args.testset)
-        create_test_set(start_tweet_id, end_tweet_id, data_points, data_interval)
+        create_test_set(start_tweet_id, end_tweet_id, data_points, data_interval, args.workers, args.rate)
     elif args.dataset:
-        break_tweet_timeline(args.dataset)
+        break_tweet_timeline(args.dataset, args.workers, args.rate)
     elif args.errortest:
-        find_estimate_error()
+        find_estimate_error(args.rounds, args.compare, args.timeline)
+    elif args.convert:
+        data_directory = os.path.join(os.path.dirname( __file__ ), '..', "data")
+        convert_timeline(os.path.join(data_directory, "TweetTimeline.txt"), os.path.join(data_directory, "TweetTimeline.bin"))
     elif args.timestamp:
         tstamp = find_tweet_timestamp(args.timestamp)
         utcdttime = datetime.utcfromtimestamp(tstamp / 1000)
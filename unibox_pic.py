@@ -9,6 +9,9 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import PrefilterBot
+from wikidata import EntityBatcher
 import wikitextparser as wtp
 import re
 
@@ -18,6 +21,7 @@ docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -29,6 +33,7 @@ class BasicBot(
 
     use_redirects = False  # treats non-redirects only
     summary_key = 'basic-changing'
+    prefilter = ('універсальна картка', 'unibox', 'unicard', 'wikidata infobox')
 
     update_options = {
         'replace': False,  # delete old text and write the new text
@@ -38,6 +43,11 @@ class BasicBot(
         'tlang': 'en',
     }
 
+    def __init__(self, generator, **kwargs) -> None:
+        # P18 is requested from Wikidata for a whole batch of pages at once
+        self.items = EntityBatcher(generator, 'claims')
+        super().__init__(generator=self.items.pages(), **kwargs)
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
         text = self.current_page.text
@@ -55,13 +65,12 @@ class BasicBot(
         
         if has_unibox != True: return None
         
-        item = pywikibot.ItemPage.fromPage(self.current_page)
-        if item.claims:
-            if 'P18' in item.claims:
-                #print(item.claims['P18'])
-                #print("----------")
-                filename = re.sub(r"\[\[commons:File:([^\]]+)\]\]", fr'[[Файл:\1|міні|250пкс|{self.current_page.title()}]]', str(item.claims['P18'][0].getTarget()))
-                text = filename + text
+        images = self.items.claim_values(self.current_page, 'P18')
+        if images:
+            #print(images)
+            #print("----------")
+            filename = f'[[Файл:{images[0]}|міні|250пкс|{self.current_page.title()}]]'
+            text = filename + text
 
         self.put_current(text, summary=summary)
 
@@ -85,6 +94,8 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
@@ -99,9 +110,9 @@ def main(*args: str) -> None:
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
@@ -8,12 +8,15 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
+import xmldump
+from botbase import CountingBot
 import mwparserfromhell
 
 # Help text for -help output
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 class RemoveLinkSpacesBot(
+    CountingBot,             # skip saves that change nothing, count pages
     SingleSiteBot,           # work on a single site only
     ConfigParserBot,         # read options from scripts.ini
     ExistingPageBot,         # skip non‐existing pages
@@ -98,12 +101,16 @@ def main(*args: str) -> None:
 
     gen_factory = pagegenerators.GeneratorFactory()
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     for arg in local_args:
         if arg.startswith('-always'):
             options['always'] = True
 
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    if dump:
+        options['always'] = True  # changes only go to the output files
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
         bot = RemoveLinkSpacesBot(generator=gen, **options)
         bot.run()
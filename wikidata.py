@@ -0,0 +1,132 @@
+"""
+Batched Wikidata lookups for pages coming from a generator.
+
+``pywikibot.ItemPage.fromPage(page)`` costs one wbgetentities request per
+page. :class:`EntityBatcher` sits between the page generator and the bot:
+it reads pages in batches of 50, asks Wikidata for the items of all of them
+in one request and then hands the pages on unchanged, so that ``treat_page``
+only looks the answer up in an in-memory LRU cache.
+
+Only the props the bot needs are requested: 'sitelinks' for transrefs.py,
+'claims' for unibox_pic.py (then only the sitelink of the local wiki is
+returned, which is needed to map items back to pages).
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from itertools import islice
+
+import pywikibot
+from pywikibot.page import SiteLink
+
+BATCH_SIZE = 50  # wbgetentities limit for ordinary accounts
+CACHE_SIZE = 1000  # entities kept in memory
+
+
+def get_entities(site, titles: list[str], props: str) -> dict[str, dict]:
+    """Return Wikidata entities connected to *titles* on *site*.
+
+    :param props: wbgetentities props, e.g. 'sitelinks' or 'claims'
+    :return: local title -> entity data; titles without an item are missing
+    """
+    dbname = site.dbName()
+    repo = site.data_repository()
+    props = set(props.split('|'))
+    params = {}
+    if 'sitelinks' not in props:
+        # needed to map titles back, but only for this wiki
+        props.add('sitelinks')
+        params['sitefilter'] = dbname
+    entities = {}
+    for start in range(0, len(titles), BATCH_SIZE):
+        data = repo.simple_request(
+            action='wbgetentities', sites=dbname,
+            titles=titles[start:start + BATCH_SIZE],
+            props='|'.join(sorted(props)), **params).submit()
+        for entity in data['entities'].values():
+            sitelink = entity.get('sitelinks', {}).get(dbname)
+            if 'missing' in entity or sitelink is None:
+                continue
+            entities[sitelink['title']] = entity
+    return entities
+
+
+class EntityBatcher:
+
+    """Prefetch Wikidata entities of generator pages, :data:`BATCH_SIZE` at a time.
+
+    Usage::
+
+        batcher = EntityBatcher(gen, 'sitelinks')
+        bot = BasicBot(generator=batcher.pages(), ...)
+        ...
+        for iterlink in batcher.iterlinks(self.current_page): ...
+
+    :param props: wbgetentities props the bot needs
+    """
+
+    def __init__(self, generator, props: str = 'sitelinks',
+                 batch_size: int = BATCH_SIZE,
+                 cache_size: int = CACHE_SIZE) -> None:
+        self.generator = generator
+        self.props = props
+        self.batch_size = batch_size
+        self.cache_size = max(cache_size, 2 * batch_size)
+        self._cache: OrderedDict[str, dict | None] = OrderedDict()
+
+    def pages(self):
+        """Yield pages of the wrapped generator, fetching entities ahead."""
+        generator = iter(self.generator)
+        while True:
+            batch = list(islice(generator, self.batch_size))
+            if not batch:
+                return
+            self._fetch(batch[0].site, [page.title() for page in batch
+                                        if page.title() not in self._cache])
+            yield from batch
+
+    def _fetch(self, site, titles: list[str]) -> None:
+        if not titles:
+            return
+        entities = get_entities(site, titles, self.props)
+        for title in titles:
+            self._cache[title] = entities.get(title)  # None: no item
+            self._cache.move_to_end(title)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def entity(self, page) -> dict | None:
+        """Return the entity data of the item of *page*, or None.
+
+        Pages that were not read through :meth:`pages`, e.g. a single page
+        given directly, are fetched on their own.
+        """
+        title = page.title()
+        if title not in self._cache:
+            self._fetch(page.site, [title])
+        self._cache.move_to_end(title)
+        return self._cache[title]
+
+    def iterlinks(self, page):
+        """Iterate through the sitelinks of *page* like ItemPage.iterlinks.
+
+        :raises pywikibot.exceptions.NoPageError: page has no item
+        """
+        entity = self.entity(page)
+        if entity is None:
+            raise pywikibot.exceptions.NoPageError(page)
+        for dbname, link in entity['sitelinks'].items():
+            yield pywikibot.Page(SiteLink(link['title'], dbname))
+
+    def claim_values(self, page, prop: str) -> list:
+        """Return the values of the *prop* statements of the item of *page*.
+
+        Values are taken from the JSON as they are, e.g. the file name for
+        P18. Statements without a value (novalue, somevalue) are left out.
+        """
+        entity = self.entity(page)
+        if entity is None:
+            return []
+        return [claim['mainsnak']['datavalue']['value']
+                for claim in entity.get('claims', {}).get(prop, [])
+                if 'datavalue' in claim['mainsnak']]
@@ -0,0 +1,175 @@
+"""
+Offline mode: run a bot over a ``pages-articles.xml.bz2`` dump.
+
+Instead of preloading every page over the API, pages are streamed from the
+dump one at a time (``pywikibot.xmlreader`` parses it with iterparse and
+clears each element after use, so memory stays bounded) and handed to the
+unchanged ``treat_page``. Nothing is saved to the wiki: every page the bot
+would change is written to a candidate list and, optionally, to a patch
+file with unified diffs.
+
+Command line options, read by :func:`handle_args`::
+
+    -dump:file          XML dump to read (.xml, .xml.bz2, .xml.gz, .xml.7z)
+    -candidates:file    titles of pages that would be changed
+                        (default: dump_candidates.txt)
+    -patch:file         unified diffs of the changes
+
+Pages are taken from namespaces given with -ns, or from the main namespace,
+and -limit stops after that many pages. Other generator and filter options
+(-cat, -page, -titleregex, ...) cannot be applied to a dump and are
+rejected. The site of the dump is the one given with -lang/-family.
+"""
+from __future__ import annotations
+
+import difflib
+from itertools import islice
+
+import pywikibot
+from pywikibot import xmlreader
+
+
+class DumpOutput:
+
+    """Write pages that would be changed to the candidate and patch files."""
+
+    def __init__(self, candidates: str, patch: str | None = None) -> None:
+        self.candidates = open(candidates, 'a', encoding='utf-8')
+        self.patch = open(patch, 'a', encoding='utf-8') if patch else None
+
+    def write(self, title: str, old: str, new: str, summary: str | None) -> None:
+        self.candidates.write(title + '\n')
+        self.candidates.flush()
+        if self.patch is None:
+            return
+        if summary:
+            self.patch.write(f'# {title}: {summary}\n')
+        diff = difflib.unified_diff(old.splitlines(keepends=True),
+                                    new.splitlines(keepends=True),
+                                    fromfile=f'a/{title}', tofile=f'b/{title}')
+        for line in diff:
+            self.patch.write(line if line.endswith('\n') else line + '\n')
+        self.patch.flush()
+
+    def close(self) -> None:
+        self.candidates.close()
+        if self.patch is not None:
+            self.patch.close()
+
+
+class DumpPage(pywikibot.Page):
+
+    """Page whose text comes from a dump and whose saves go to a file.
+
+    The few Page methods bots call before saving are answered from the dump,
+    so that a run needs no API requests at all.
+    """
+
+    def __init__(self, site, entry, output: DumpOutput) -> None:
+        super().__init__(site, entry.title)
+        self.text = entry.text
+        self._dump_text = entry.text
+        self._revid = int(entry.revisionid)
+        self._output = output
+
+    def exists(self) -> bool:
+        return True
+
+    def isRedirectPage(self) -> bool:  # noqa: N802
+        return False  # redirects are skipped while reading the dump
+
+    def extract(self, variant: str = 'plain', *, lines: int | None = None,
+                **kwargs) -> str:
+        """Return the first lines of the wikitext instead of TextExtracts."""
+        return '\n'.join(self.text.splitlines()[:lines or 3])
+
+    def save(self, summary: str | None = None, *args, **kwargs) -> None:
+        if self.text != self._dump_text:
+            self._output.write(self.title(), self._dump_text, self.text,
+                               summary)
+            self._dump_text = self.text
+
+
+class DumpMode:
+
+    """Generator of :class:`DumpPage` objects for one dump file."""
+
+    def __init__(self, filename: str, candidates: str,
+                 patch: str | None = None) -> None:
+        self.filename = filename
+        self.candidates = candidates
+        self.patch = patch
+
+    def generator(self, site=None, namespaces=None):
+        """Yield pages of *namespaces* (ids, default: main) from the dump."""
+        site = site or pywikibot.Site()
+        namespaces = set(namespaces or {0})
+        output = DumpOutput(self.candidates, self.patch)
+        try:
+            for entry in xmlreader.XmlDump(self.filename).parse():
+                if entry.isredirect or int(entry.ns) not in namespaces:
+                    continue
+                yield DumpPage(site, entry, output)
+        finally:
+            output.close()
+
+
+def handle_args(args: list[str]) -> tuple[list[str], DumpMode | None]:
+    """Take dump options out of *args*.
+
+    :return: remaining arguments, and the dump mode if -dump was given
+    """
+    options = {}
+    local_args = []
+    for arg in args:
+        option, _, value = arg.partition(':')
+        if option in ('-dump', '-candidates', '-patch'):
+            if not value:
+                value = pywikibot.input('Please enter a value for ' + option)
+            options[option[1:]] = value
+        else:
+            local_args.append(arg)
+
+    if 'dump' not in options:
+        return local_args, None
+    return local_args, DumpMode(options['dump'],
+                                options.get('candidates', 'dump_candidates.txt'),
+                                options.get('patch'))
+
+
+def unsupported_options(gen_factory) -> list[str]:
+    """Return the kinds of factory options that a dump run cannot apply."""
+    ignored = {
+        'page generators': gen_factory.gens,
+        'title filters': (gen_factory.titlefilter_list
+                          or gen_factory.titlenotfilter_list),
+        'text filters': (gen_factory.articlefilter_list
+                         or gen_factory.articlenotfilter_list),
+        'category filters': gen_factory.catfilter_list,
+        'claim filters': gen_factory.claimfilter_list,
+        'quality filters': gen_factory.qualityfilter_list,
+        '-subpage': gen_factory.subpage_max_depth is not None,
+        '-redirect': gen_factory.redirectfilter is not None,
+        '-intersect': gen_factory.intersect,
+    }
+    return [name for name, given in ignored.items() if given]
+
+
+def get_generator(gen_factory, dump: DumpMode | None):
+    """Return pages from the dump if given, otherwise from the factory.
+
+    With a dump, None is returned if other generator or filter options than
+    -ns and -limit were given, as they would be silently ignored.
+    """
+    if dump is None:
+        # The preloading option is responsible for downloading multiple
+        # pages from the wiki simultaneously.
+        return gen_factory.getCombinedGenerator(preload=True)
+    unsupported = unsupported_options(gen_factory)
+    if unsupported:
+        pywikibot.error('-dump only supports -ns and -limit, not '
+                        + ', '.join(unsupported))
+        return None
+    namespaces = [ns.id for ns in gen_factory.namespaces]
+    return islice(dump.generator(gen_factory.site, namespaces),
+                  gen_factory.limit)
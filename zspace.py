@@ -8,27 +8,16 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import mwparserfromhell
-import re
+import xmldump
+from botbase import PrefilterBot
+from invisible import Normalizer, benchmark
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
-invisible_chars_re = re.compile(
-    r'[\u00A0\u200A\u200B-\u200D\u202F\uFEFF\u00AD\uFFFD\u007F\u0009]'
-)
-def replace_invisible(match):
-    char = match.group()
-    # Заміна на звичайний пробіл для більшості випадків
-    if char in ('\u00A0', '\u202F', '\u200A', '\u0009'):
-        return ' '
-    elif char in ('\u00AD'):
-        return '-'
-    # Видалення нуль-ширинних пробілів та інших невидимих символів
-    return ''
-
 class BasicBot(
+    PrefilterBot,  # skips pages without any of the prefilter strings
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
     ConfigParserBot,  # A bot which reads options from scripts.ini setting file
@@ -46,24 +35,17 @@ class BasicBot(
         'summary': "[[Вікіпедія:Завдання_для_ботів#Невидимі символи в шаблонах cite|Виправлення невидимих символів у шаблонах cite]]",  # your own bot summary
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the page
+        'contexts': 'refs',  # comma list of refs, cite, urls
     }
-    def treat_page(self) -> None:
-        text = self.current_page.text
-        parsed = mwparserfromhell.parse(text)
-        changed = False
 
-        # Iterate through <ref> tags in the parsed content
-        for ref_tag in parsed.filter_tags(matches=lambda tag: tag.tag.lower() == 'ref'):
-            original_value = str(ref_tag.contents)
-            new_value = invisible_chars_re.sub(replace_invisible, original_value)
-
-            if new_value != original_value:
-                ref_tag.contents = new_value
-                changed = True
-
-        if changed:
-            text = str(parsed)
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.normalizer = Normalizer(self.opt.contexts.split(','))
+        # pages without any of the characters are not even parsed
+        self.prefilter = self.normalizer.prefilter
 
+    def treat_page(self) -> None:
+        text = self.normalizer.apply(self.current_page.text)
         self.put_current(text, summary=self.opt.summary)
 
 
@@ -79,23 +61,32 @@ def main(*args: str) -> None:
 
     # Process pagegenerators arguments
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     # Parse your own command line arguments
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary', 'text'):
+        if option in ('summary', 'text', 'contexts'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'benchmark':
+            options[option] = int(value or 5)  # rounds
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    # -benchmark[:rounds] only times the cleanup of the pages
+    if 'benchmark' in options and gen:
+        normalizer = Normalizer(options.get('contexts', 'refs').split(','))
+        benchmark(gen, normalizer, options.pop('benchmark'))
+        return
+    if dump:
+        options['always'] = True  # changes only go to the output files
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
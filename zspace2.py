@@ -7,24 +7,14 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import mwparserfromhell
-import re
+import xmldump
+from botbase import PrefilterBot
+from invisible import Normalizer, benchmark
 
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
-# 1) stray-newline: newline not followed by |, {, or }
-newline_re = re.compile(r'\n(?!\s*[\|{}<\n])')
-
-# 2) spaces: various non-breaking or thin spaces + tabs
-space_re = re.compile(r'[\u00A0\u202F\u200A\u0009]')
-
-# 3) soft hyphen → literal hyphen
-hyphen_re = re.compile(r'\u00AD')
-
-# 4) other invisibles to just drop
-drop_re = re.compile(r'[\u200B-\u200D\uFEFF\uFFFD\u007F]')
-
 class BasicBot(
+    PrefilterBot,
     SingleSiteBot,
     ConfigParserBot,
     ExistingPageBot,
@@ -37,51 +27,51 @@ class BasicBot(
         'summary': "[[Вікіпедія:Завдання_для_ботів#Невидимі символи в шаблонах cite|Виправлення невидимих символів у шаблонах cite]]",
         'text': 'Test',
         'top': False,
+        'contexts': 'refs',  # comma list of refs, cite, urls
     }
 
-    def clean_ref_contents(self, text: str) -> str:
-        # 1: turn any stray newline into a space
-        text = newline_re.sub(' ', text)
-        # 2: normalize various spaces/tabs → regular space
-        text = space_re.sub(' ', text)
-        # 3: soft hyphens → hyphen-minus
-        text = hyphen_re.sub('-', text)
-        # 4: drop zero-width & other invisibles
-        text = drop_re.sub('', text)
-        return text
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        # also turns stray newlines into spaces
+        self.normalizer = Normalizer(self.opt.contexts.split(','),
+                                     newlines=True)
+        self.prefilter = self.normalizer.prefilter
 
     def treat_page(self) -> None:
         page_text = self.current_page.text
-        parsed = mwparserfromhell.parse(page_text)
-        changed = False
-
-        for ref in parsed.filter_tags(matches=lambda t: t.tag.lower() == 'ref'):
-            orig = str(ref.contents)
-            cleaned = self.clean_ref_contents(orig)
-            if cleaned != orig:
-                ref.contents = cleaned
-                changed = True
-
-        if changed:
-            self.put_current(str(parsed), summary=self.opt.summary)
+        cleaned = self.normalizer.apply(page_text)
+        if cleaned != page_text:
+            self.put_current(cleaned, summary=self.opt.summary)
 
 def main(*args: str) -> None:
     options = {}
     local_args = pywikibot.handle_args(args)
     gen_factory = pagegenerators.GeneratorFactory()
     local_args = gen_factory.handle_args(local_args)
+    # -dump:file reads the pages from an XML dump instead of the wiki
+    local_args, dump = xmldump.handle_args(local_args)
 
     for arg in local_args:
         arg, _, val = arg.partition(':')
         opt = arg[1:]
-        if opt in ('summary', 'text'):
+        if opt in ('summary', 'text', 'contexts'):
             if not val:
                 pywikibot.input(f'Please enter a value for {arg}')
             options[opt] = val
+        elif opt == 'benchmark':
+            options[opt] = int(val or 5)  # rounds
         else:
             options[opt] = True
 
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = xmldump.get_generator(gen_factory, dump)
+    # -benchmark[:rounds] only times the cleanup of the pages
+    if 'benchmark' in options and gen:
+        normalizer = Normalizer(options.get('contexts', 'refs').split(','),
+                                newlines=True)
+        benchmark(gen, normalizer, options.pop('benchmark'))
+        return
+    if dump:
+        options['always'] = True  # changes only go to the output files
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
         BasicBot(generator=gen, **options).run()
 